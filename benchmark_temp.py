@@ -0,0 +1,228 @@
+'''
+World Temperature Database Benchmark Script
+Version 1.0.
+
+This script measures the performance of the database created by db_create.py. It builds a copy of the database in the original layout (one table per workbook, see schema_temp.py) and compares it with the compact layout for file size, page reads and query time, using the queries performed by the rest of the scripts in the set. It also reports the load time, memory cost and per-query speedup of hot mode (see database_temp.py), and compares the sharded layout with the single file when shard files exist (see shard_temp.py).
+
+See readme for more details.
+'''
+
+import sqlite3
+import os
+import shutil
+import tempfile
+import time
+import datetime
+import schema_temp
+import shard_temp
+import database_temp
+
+# Queries performed by sql_temp.py, excel_temp.py and numpy_temp.py (these run against the 'Country', 'MajorCity' and 'State' views of the compact layout).
+STANDARD_QUERIES = {
+'Southern Cities': '''
+SELECT distinct City, Country, Latitude, Longitude
+FROM MajorCity
+WHERE Latitude LIKE '%S'
+ORDER BY Country;''',
+'Queensland 2000': '''
+SELECT min(AverageTemperature), max(AverageTemperature), avg(AverageTemperature)
+FROM State
+WHERE state='Queensland' AND
+    country='Australia' AND
+    Year = 2000;''',
+'Chinese Cities': '''
+SELECT printf('%04d', Year), City, AVG(AverageTemperature)
+FROM MajorCity
+WHERE Country='China'
+GROUP BY Year, City
+ORDER BY Year, City;''',
+'Australian States': '''
+SELECT Year, State, AVG(AverageTemperature)
+FROM State
+WHERE Country='Australia'
+GROUP BY Year, State
+ORDER BY Year, State;''',
+'Australia': '''
+SELECT Year, AVG(AverageTemperature)
+FROM Country
+WHERE Country='Australia'
+GROUP BY Year;''',
+}
+
+# The same queries as they were written for the original layout (which does not have Year and Month attributes).
+ORIGINAL_QUERIES = {
+'Southern Cities': STANDARD_QUERIES['Southern Cities'],
+'Queensland 2000': '''
+SELECT min(AverageTemperature), max(AverageTemperature), avg(AverageTemperature)
+FROM State
+WHERE state='Queensland' AND
+    country='Australia' AND
+    Date BETWEEN '2000-01-01' AND '2000-12-31';''',
+'Chinese Cities': '''
+SELECT SUBSTR(date, 0, 5) As Year, City, AVG(AverageTemperature)
+FROM MajorCity
+WHERE Country='China'
+GROUP BY Year, City
+ORDER BY Year, City;''',
+'Australian States': '''
+SELECT CAST(SUBSTR(date, 0, 5) As INTEGER) As Year, State, AVG(AverageTemperature)
+FROM State
+WHERE Country='Australia'
+GROUP BY Year, State
+ORDER BY Year, State;''',
+'Australia': '''
+SELECT CAST(SUBSTR(date, 0, 5) As INTEGER) As Year, AVG(AverageTemperature)
+FROM Country
+WHERE Country='Australia'
+GROUP BY Year;''',
+}
+
+REPEATS = 3 # Number of times each query is timed (the fastest time is reported).
+
+
+def bytesRead():
+    '''Return the number of bytes read by this process so far, or None if this is not available (Linux only).'''
+    try:
+        with open('/proc/self/io') as ioFile:
+            for line in ioFile:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def pageReads(path, query):
+    '''Run a query on a new connection (with an empty page cache) and return the number of database pages read, or None if this cannot be measured.'''
+    connection = sqlite3.connect(path)
+    pageSize = connection.execute("PRAGMA page_size;").fetchone()[0]
+    connection.execute("PRAGMA mmap_size = 0;") # Pages must be read with read() calls to be counted.
+    connection.execute("Select count(*) From sqlite_master;").fetchone() # Read the schema before measuring.
+    before = bytesRead()
+    connection.execute(query).fetchall()
+    after = bytesRead()
+    connection.close()
+    if before is None or after is None:
+        return None
+    return (after - before) // pageSize
+
+
+def queryTime(path, query, repeats=REPEATS):
+    '''Return the fastest time (in seconds) taken to run a query and fetch all of its rows.'''
+    connection = sqlite3.connect(path)
+    times = []
+    for repeat in range(repeats):
+        start = time.perf_counter()
+        connection.execute(query).fetchall()
+        times.append(time.perf_counter() - start)
+    connection.close()
+    return min(times)
+
+
+def buildLegacyCopy(sourcePath, legacyPath):
+    '''Build a copy of a compact layout database in the original layout (three tables with repeated names and their indexes).'''
+    sourceConnection = sqlite3.connect(sourcePath)
+    titles = schema_temp.tableTitles(sourceConnection)
+    sourceConnection.close()
+    connection = sqlite3.connect(legacyPath)
+    connection.execute("ATTACH DATABASE ? AS source;", (sourcePath,))
+    schema_temp.createLegacySchema(connection.cursor(), titles)
+    for tableName in ['Country', 'MajorCity', 'State']:
+        columns = ', '.join('"{}"'.format(title) for title in titles[tableName])
+        connection.execute('Insert Into main."{0}" Select {1} From source."{0}";'.format(tableName, columns)) # Copy every record through the compatibility views.
+    connection.commit()
+    connection.execute("DETACH DATABASE source;")
+    connection.execute("VACUUM;")
+    connection.close()
+
+
+def compareLayouts(path):
+    '''Print file size, page reads and query times of the compact layout database and of a copy in the original layout.'''
+    legacyDirectory = tempfile.mkdtemp()
+    legacyPath = os.path.join(legacyDirectory, 'Temperature_Data_Legacy.db')
+    print("Building a copy of the database in the original layout...")
+    buildLegacyCopy(path, legacyPath)
+    print("Done.\n")
+
+    layouts = [('Compact', path), ('Original', legacyPath)]
+    print("File size")
+    for name, layoutPath in layouts:
+        print("     {:<10} {:>12,} bytes".format(name, os.path.getsize(layoutPath)))
+    print("     Ratio      {:>12.2f}\n".format(os.path.getsize(legacyPath) / os.path.getsize(path)))
+
+    print("{:<20}{:>16}{:>16}{:>14}{:>14}".format('Query', 'Compact Pages', 'Original Pages', 'Compact (s)', 'Original (s)'))
+    for queryName in STANDARD_QUERIES:
+        queries = [STANDARD_QUERIES[queryName], ORIGINAL_QUERIES[queryName]] # One query for each layout.
+        pages = [pageReads(layoutPath, query) for (name, layoutPath), query in zip(layouts, queries)]
+        times = [queryTime(layoutPath, query) for (name, layoutPath), query in zip(layouts, queries)]
+        print("{:<20}{:>16}{:>16}{:>14.4f}{:>14.4f}".format(queryName, *['n/a' if count is None else count for count in pages], *times))
+    print()
+    shutil.rmtree(legacyDirectory)
+
+
+def compareHotMode(path):
+    '''Print the time and memory taken to copy a database into memory (hot mode), and the speedup of each query in memory over the database file.'''
+    connection, seconds, memoryUsed = database_temp.loadIntoMemory(path)
+    print("Load time      {:>12.3f} seconds".format(seconds))
+    print("Memory used    {:>12}\n".format('unknown' if memoryUsed is None else '{:.1f} MB'.format(memoryUsed / 1048576)))
+    print("{:<20}{:>14}{:>14}{:>10}".format('Query', 'File (s)', 'Memory (s)', 'Speedup'))
+    for queryName, query in STANDARD_QUERIES.items():
+        diskConnection = sqlite3.connect(path) # A new connection starts with an empty page cache (as each script does).
+        start = time.perf_counter()
+        diskConnection.execute(query).fetchall()
+        diskTime = time.perf_counter() - start
+        diskConnection.close()
+        start = time.perf_counter()
+        connection.execute(query).fetchall()
+        memoryTime = time.perf_counter() - start
+        print("{:<20}{:>14.4f}{:>14.4f}{:>9.1f}x".format(queryName, diskTime, memoryTime, diskTime / memoryTime if memoryTime > 0 else float('inf')))
+    connection.close()
+    print()
+
+
+def resultsMatch(first, second):
+    '''Return True if two sets of grouped results ({group: values}) are the same (to within rounding).'''
+    if first.keys() != second.keys():
+        return False
+    for key in first:
+        for firstValue, secondValue in zip(first[key], second[key]):
+            if (firstValue is None) != (secondValue is None):
+                return False
+            if firstValue is not None and abs(firstValue - secondValue) > 1e-9 * max(1.0, abs(firstValue)):
+                return False
+    return True
+
+
+def compareShards(path, paths):
+    '''Print the time taken by per-country aggregates (average and percentiles over 'MajorCity' and 'State') on the single database file and on the shard files.'''
+    layouts = [('Single file', [path], False), ('Shards (threads)', paths, False), ('Shards (processes)', paths, True)]
+    print("{:<20}{:>14}{:>14}{:>14}{:>14}".format('Layout', 'City Avg (s)', 'City Pct (s)', 'State Avg (s)', 'State Pct (s)'))
+    results = {}
+    for name, layoutPaths, processes in layouts:
+        times = []
+        for source in ['MajorCity', 'State']:
+            start = time.perf_counter()
+            results[(name, source, 'Average')] = shard_temp.groupAverages(layoutPaths, 'AverageTemperature', source, 'Country', processes=processes)
+            times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            results[(name, source, 'Percentile')] = shard_temp.groupPercentiles(layoutPaths, 'AverageTemperature', source, 'Country', [10, 50, 90], processes=processes)
+            times.append(time.perf_counter() - start)
+        print("{:<20}{:>14.4f}{:>14.4f}{:>14.4f}{:>14.4f}".format(name, *times))
+    matching = all(resultsMatch(results[(name, source, statistic)], results[('Single file', source, statistic)]) for name, layoutPaths, processes in layouts for source in ['MajorCity', 'State'] for statistic in ['Average', 'Percentile'])
+    print("Shard results match single file results: {}\n".format(matching))
+
+
+if __name__ == '__main__':
+    print("Initializing.\n")
+    if not os.path.isfile("Temperature_Data.db"): # Check that database file exists...
+        print("Error, 'Temperature_Data.db' does not exist. Please run 'db_create.py' first.") # Prompt to run the creation script if it does not.
+        exit(0)
+    print("Benchmarking 'Temperature_Data.db'", datetime.datetime.now(), "\nSqlite version:", sqlite3.sqlite_version, "\n")
+    print("Comparing the compact layout with the original layout...\n")
+    compareLayouts("Temperature_Data.db")
+    print("Comparing queries on the database file with hot mode (in memory)...\n")
+    compareHotMode("Temperature_Data.db")
+    if len(shard_temp.shardPaths()) > 0: # The sharded layout is optional.
+        print("Comparing the single file layout with the sharded layout ({} shards)...\n".format(len(shard_temp.shardPaths())))
+        compareShards("Temperature_Data.db", shard_temp.shardPaths())
+    print("Benchmark complete.", datetime.datetime.now())
@@ -0,0 +1,197 @@
+'''
+World Temperature Cross-Series Correlation Script
+Version 1.0.
+
+This script compares every state and major city in the database with every other state and major city. For each pair of series it calculates the correlation of their monthly temperature anomalies (the difference from each series' average for that calendar month, so that the seasons do not dominate the result), and the mean difference between their monthly temperatures.
+
+Missing data is handled pairwise. Each statistic for a pair only uses the months where both series have data (and is nan when there are too few of these months). The work is split into blocks of series so that only a few blocks are held in memory at a time, and the blocks are calculated in parallel on several cores (numpy releases the interpreter lock while it multiplies matrices).
+
+The results are saved in the 'Correlation' folder as memory-mapped numpy arrays (correlation.npy, difference.npy and overlap.npy, one row and one column per series in series.csv) and as a table of the most correlated neighbours of each series (neighbours.csv).
+
+See readme for more details.
+'''
+
+import os
+import csv
+import time
+import concurrent.futures
+import numpy
+from numpy.lib.format import open_memmap
+import stream_temp
+
+BLOCK_SIZE = 256 # Number of series in each block.
+TOP_NEIGHBOURS = 10 # Number of neighbours stored for each series.
+MINIMUM_OVERLAP = 120 # Minimum number of shared months (ten years) for a pair of series to be compared.
+OUTPUT_DIRECTORY = "Correlation"
+
+# Series (dimension table, fact table, series id) compared by the script.
+SERIES_SOURCES = [('State', 'DimState', 'FactState', 'StateId'), ('City', 'DimCity', 'FactCity', 'CityId')]
+
+
+def loadSeries(connection, chunkSize=stream_temp.CHUNK_SIZE):
+    '''
+    Return (list of series labels (kind, country, name), first year, array of monthly temperatures) for every state and major city.
+    The array has one row per series and one column per month (starting in January of the first year), with nan for missing data.
+    '''
+    firstYear, lastYear = connection.execute("SELECT MIN(Year), MAX(Year) FROM (SELECT Year FROM FactState UNION ALL SELECT Year FROM FactCity);").fetchone()
+    labels = []
+    rows = {} # Row of each series in the array (by kind and series id).
+    for kind, dimension, fact, seriesId in SERIES_SOURCES:
+        for recordId, country, name in connection.execute("SELECT d.{0}, c.Name, d.Name FROM {1} d JOIN DimCountry c ON c.CountryId = d.CountryId ORDER BY c.Name, d.Name;".format(seriesId, dimension)):
+            rows[(kind, recordId)] = len(labels)
+            labels.append((kind, country, name))
+    values = numpy.full((len(labels), 0 if firstYear is None else (lastYear - firstYear + 1) * 12), numpy.nan, dtype=numpy.float32)
+
+    for kind, dimension, fact, seriesId in SERIES_SOURCES:
+        seriesRows = numpy.full(max([recordId for seriesKind, recordId in rows if seriesKind == kind], default=0) + 1, -1)
+        for (seriesKind, recordId), row in rows.items():
+            if seriesKind == kind:
+                seriesRows[recordId] = row # Lookup from series id to array row.
+        cursor = connection.execute("SELECT {0}, Year, Month, AverageTemperature FROM {1} WHERE AverageTemperature IS NOT NULL;".format(seriesId, fact))
+        while True:
+            chunk = cursor.fetchmany(chunkSize)
+            if not chunk:
+                break
+            chunk = numpy.array(chunk, dtype=float)
+            values[seriesRows[chunk[:, 0].astype(int)], ((chunk[:, 1] - firstYear) * 12 + chunk[:, 2] - 1).astype(int)] = chunk[:, 3] # Place each chunk of records in the array at once.
+    return labels, firstYear, values
+
+
+def removeSeasonalCycle(values):
+    '''Return the anomalies of monthly series (each value minus the series' average for that calendar month). Columns must start in January.'''
+    anomalies = numpy.array(values, dtype=float)
+    for month in range(12):
+        monthValues = anomalies[:, month::12]
+        present = ~numpy.isnan(monthValues)
+        counts = present.sum(axis=1, keepdims=True)
+        totals = numpy.where(present, monthValues, 0.0).sum(axis=1, keepdims=True)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            anomalies[:, month::12] = monthValues - totals / counts
+    return anomalies
+
+
+def blockStatistics(rawRows, anomalyRows, rawColumns, anomalyColumns, minimumOverlap=MINIMUM_OVERLAP):
+    '''
+    Return (correlation, mean difference, overlap) between a block of row series and a block of column series (each array has one row per series).
+    Every sum is taken over the months where both series have data, using matrix products of the values (with missing values set to 0) and of the masks of present values.
+    '''
+    rowMask = (~numpy.isnan(rawRows)).astype(float)
+    columnMask = (~numpy.isnan(rawColumns)).astype(float)
+    rawRows, rawColumns = numpy.nan_to_num(rawRows), numpy.nan_to_num(rawColumns)
+    anomalyRows, anomalyColumns = numpy.nan_to_num(anomalyRows), numpy.nan_to_num(anomalyColumns)
+
+    overlap = rowMask @ columnMask.T # Number of shared months.
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        difference = (rawRows @ columnMask.T - rowMask @ rawColumns.T) / overlap # Mean of (row series - column series).
+        rowSums = anomalyRows @ columnMask.T
+        columnSums = rowMask @ anomalyColumns.T
+        covariance = anomalyRows @ anomalyColumns.T - rowSums * columnSums / overlap
+        rowVariance = (anomalyRows ** 2) @ columnMask.T - rowSums ** 2 / overlap
+        columnVariance = rowMask @ (anomalyColumns ** 2).T - columnSums ** 2 / overlap
+        correlation = numpy.clip(covariance / numpy.sqrt(rowVariance * columnVariance), -1.0, 1.0)
+    tooFew = overlap < max(minimumOverlap, 2)
+    correlation[tooFew] = numpy.nan
+    difference[tooFew] = numpy.nan
+    return correlation, difference, overlap
+
+
+def rowBlock(start, raw, anomalies, outputs, blockSize, topNeighbours, minimumOverlap):
+    '''Calculate one block of rows against every block of columns, write them to the output arrays and return the top neighbours of each row.'''
+    end = min(start + blockSize, len(raw))
+    correlationRows = numpy.empty((end - start, len(raw)))
+    for columnStart in range(0, len(raw), blockSize):
+        columnEnd = min(columnStart + blockSize, len(raw))
+        correlation, difference, overlap = blockStatistics(raw[start:end], anomalies[start:end], raw[columnStart:columnEnd], anomalies[columnStart:columnEnd], minimumOverlap)
+        correlationRows[:, columnStart:columnEnd] = correlation
+        if 'correlation' in outputs:
+            outputs['correlation'][start:end, columnStart:columnEnd] = correlation
+            outputs['difference'][start:end, columnStart:columnEnd] = difference
+            outputs['overlap'][start:end, columnStart:columnEnd] = overlap
+    correlationRows[numpy.arange(end - start), numpy.arange(start, end)] = numpy.nan # A series is not its own neighbour.
+    ranked = numpy.where(numpy.isnan(correlationRows), -numpy.inf, correlationRows)
+    count = min(topNeighbours, len(raw))
+    neighbours = numpy.argpartition(-ranked, count - 1, axis=1)[:, :count] if count > 0 else numpy.zeros((end - start, 0), dtype=int)
+    order = numpy.argsort(-numpy.take_along_axis(ranked, neighbours, axis=1), axis=1, kind='stable')
+    neighbours = numpy.take_along_axis(neighbours, order, axis=1)
+    return start, neighbours, numpy.take_along_axis(correlationRows, neighbours, axis=1)
+
+
+def computeMatrices(values, directory=OUTPUT_DIRECTORY, blockSize=BLOCK_SIZE, topNeighbours=TOP_NEIGHBOURS, minimumOverlap=MINIMUM_OVERLAP, workers=None, storeMatrices=True):
+    '''
+    Calculate the pairwise statistics of every series (rows of values) in parallel blocks.
+    Returns (neighbours, neighbour correlations), each with one row per series (most correlated first, -1 and nan where there are not enough neighbours).
+    If storeMatrices is True the full matrices are also written to memory-mapped arrays in directory (otherwise only the neighbours are kept, for very large sets of series).
+    '''
+    raw = numpy.asarray(values, dtype=float)
+    anomalies = removeSeasonalCycle(raw)
+    count = len(raw)
+    outputs = {}
+    if storeMatrices:
+        os.makedirs(directory, exist_ok=True)
+        outputs['correlation'] = open_memmap(os.path.join(directory, 'correlation.npy'), mode='w+', dtype=numpy.float32, shape=(count, count))
+        outputs['difference'] = open_memmap(os.path.join(directory, 'difference.npy'), mode='w+', dtype=numpy.float32, shape=(count, count))
+        outputs['overlap'] = open_memmap(os.path.join(directory, 'overlap.npy'), mode='w+', dtype=numpy.int32, shape=(count, count))
+    neighbours = numpy.full((count, topNeighbours), -1, dtype=int)
+    neighbourCorrelations = numpy.full((count, topNeighbours), numpy.nan)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        tasks = [executor.submit(rowBlock, start, raw, anomalies, outputs, blockSize, topNeighbours, minimumOverlap) for start in range(0, count, blockSize)]
+        for task in concurrent.futures.as_completed(tasks):
+            start, blockNeighbours, blockCorrelations = task.result()
+            valid = ~numpy.isnan(blockCorrelations)
+            width = blockNeighbours.shape[1]
+            neighbours[start:start + len(blockNeighbours), :width] = numpy.where(valid, blockNeighbours, -1)
+            neighbourCorrelations[start:start + len(blockNeighbours), :width] = blockCorrelations
+    for output in outputs.values():
+        output.flush()
+    return neighbours, neighbourCorrelations
+
+
+def writeNeighbours(path, labels, neighbours, neighbourCorrelations, differences=None, overlaps=None):
+    '''Write the neighbour table (one row per series and neighbour) to a csv file. The mean difference and overlap are added when their matrices are given (from the same run of computeMatrices).'''
+    with open(path, 'w', newline='') as csvFile:
+        writer = csv.writer(csvFile)
+        writer.writerow(['Kind', 'Country', 'Name', 'Rank', 'Neighbour Kind', 'Neighbour Country', 'Neighbour Name', 'Correlation', 'Mean Difference', 'Shared Months'])
+        for row, label in enumerate(labels):
+            for rank, neighbour in enumerate(neighbours[row]):
+                if neighbour < 0:
+                    break
+                extra = ['', ''] if differences is None else ['{:.3f}'.format(differences[row, neighbour]), int(overlaps[row, neighbour])]
+                writer.writerow(list(label) + [rank + 1] + list(labels[neighbour]) + ['{:.4f}'.format(neighbourCorrelations[row, rank])] + extra)
+
+
+if __name__ == '__main__':
+    print("Initializing.\n")
+    import datetime
+    import database_temp
+    from os.path import isfile
+    if not isfile("Temperature_Data.db"): # Check that database file exists...
+        print("Error, 'Temperature_Data.db' does not exist. Please run 'db_create.py' first.") # Prompt to run the creation script if it does not.
+        exit(0)
+    dbConnection = database_temp.openDatabase("Temperature_Data.db", database_temp.hotModeRequested())
+    dbGeneration = database_temp.databaseGeneration(dbConnection)
+    print("Connected to database.", datetime.datetime.now(), "\n")
+    print("Loading monthly data for all states and major cities...")
+    while True:
+        seriesLabels, firstYear, monthlyValues = loadSeries(dbConnection)
+        dbConnection, loadedGeneration = database_temp.reopenIfRebuilt(dbConnection, "Temperature_Data.db", dbGeneration) # The series are read by several queries, so they are read again if the database was replaced part way through.
+        if loadedGeneration == dbGeneration:
+            break
+        dbGeneration = loadedGeneration
+    database_temp.closeDatabase(dbConnection)
+    print("Success. {} series over {} months (from {}).\n".format(monthlyValues.shape[0], monthlyValues.shape[1], firstYear))
+
+    print("Calculating correlation and mean difference matrices (blocks of {} series)...".format(BLOCK_SIZE))
+    start = time.perf_counter()
+    seriesNeighbours, seriesNeighbourCorrelations = computeMatrices(monthlyValues)
+    print("Success. Completed in {:.2f} seconds.\n".format(time.perf_counter() - start))
+
+    print("Saving results to '{}'...".format(OUTPUT_DIRECTORY))
+    with open(os.path.join(OUTPUT_DIRECTORY, 'series.csv'), 'w', newline='') as seriesFile:
+        seriesWriter = csv.writer(seriesFile)
+        seriesWriter.writerow(['Row', 'Kind', 'Country', 'Name'])
+        for row, label in enumerate(seriesLabels):
+            seriesWriter.writerow([row] + list(label)) # Row/column number of each series in the saved arrays.
+    differenceMatrix = numpy.load(os.path.join(OUTPUT_DIRECTORY, 'difference.npy'), mmap_mode='r') # Written by computeMatrices above (the matrices are stored by default).
+    overlapMatrix = numpy.load(os.path.join(OUTPUT_DIRECTORY, 'overlap.npy'), mmap_mode='r')
+    writeNeighbours(os.path.join(OUTPUT_DIRECTORY, 'neighbours.csv'), seriesLabels, seriesNeighbours, seriesNeighbourCorrelations, differenceMatrix, overlapMatrix)
+    print("Success.", datetime.datetime.now())
@@ -0,0 +1,206 @@
+'''
+World Temperature Database Connection Module
+Version 1.0.
+
+This module opens and closes the database connections used by sql_temp.py, excel_temp.py, numpy_temp.py, spatial_temp.py and correlate_temp.py.
+
+Each script can be run in 'hot' mode (by adding --hot to the command, eg. 'python sql_temp.py --hot'). In hot mode the whole database file is copied into an in-memory database (using the sqlite backup API) when it is opened, so every query runs in memory rather than reading the file from disk (see section 4.3 of the readme). Tables changed in the in-memory database (such as the 'Southern Cities' table added by sql_temp.py) are copied back to the database file when it is closed, in a single write transaction that leaves the other tables in the file untouched. The time taken to load the database and the extra memory used are displayed.
+
+Databases are used in WAL (write-ahead log) mode, so scripts reading the database are not blocked while it is being written to. db_create.py builds each new version of the database in a separate file and then publishes it over the existing file in a single transaction (see publishDatabase). Readers that are part way through a query continue to see the previous version, and their next query sees the new version. Every published version has a generation number (stored in the file's user_version), which readers check after waiting for the user (excel_temp.py, numpy_temp.py and spatial_temp.py) or after several queries (correlate_temp.py) to find out that the database has been rebuilt and reopen it (see reopenIfRebuilt).
+
+See readme for more details.
+'''
+
+import os
+import re
+import sys
+import time
+import sqlite3
+
+HOT_MODE_ARGUMENT = '--hot' # Command line argument that turns on hot mode.
+BUILD_SUFFIX = '.rebuild' # Added to a database file name to give the name of the file its next version is built in.
+
+# Statements that change a table, view or index (the authorizer is given the object name first and, for indexes, the table name second).
+WRITE_ACTIONS = {sqlite3.SQLITE_INSERT, sqlite3.SQLITE_UPDATE, sqlite3.SQLITE_DELETE, sqlite3.SQLITE_CREATE_TABLE, sqlite3.SQLITE_DROP_TABLE, sqlite3.SQLITE_CREATE_VIEW, sqlite3.SQLITE_DROP_VIEW}
+INDEX_ACTIONS = {sqlite3.SQLITE_CREATE_INDEX, sqlite3.SQLITE_DROP_INDEX}
+
+createPattern = re.compile(r'^(\s*CREATE\s+(?:UNIQUE\s+)?(?:TABLE|VIEW|INDEX|TRIGGER)\s+(?:IF\s+NOT\s+EXISTS\s+)?)', re.IGNORECASE) # Start of a definition, up to the object name.
+
+
+class HotConnection(sqlite3.Connection):
+    '''Connection to an in-memory copy of a database file (remembers the file and which tables have been changed so they can be copied back).'''
+    diskPath = None # Path of the database file that was copied into memory.
+    loadedGeneration = 0 # Generation number of the database file when the copy was made.
+    changedTables = frozenset() # Names of the tables (and views) changed since the copy was made.
+
+    def recordChange(self, action, name, tableName, database, trigger):
+        '''Authorizer callback. Records the table written to by each statement as it is prepared (every statement is allowed).'''
+        if action in INDEX_ACTIONS:
+            name = tableName
+        if database == 'main' and (action in WRITE_ACTIONS or action in INDEX_ACTIONS) and not name.startswith('sqlite_'):
+            self.changedTables.add(name)
+        return sqlite3.SQLITE_OK
+
+
+def hotModeRequested():
+    '''Return True if the script was run with the hot mode argument.'''
+    return HOT_MODE_ARGUMENT in sys.argv[1:]
+
+
+def residentMemory():
+    '''Return the memory used by this process (resident set size in bytes), or None if this is not available (Linux only).'''
+    try:
+        with open('/proc/self/status') as statusFile:
+            for line in statusFile:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def loadIntoMemory(path):
+    '''Copy a database file into a new in-memory database and return (connection, seconds taken, extra memory used in bytes or None).'''
+    memoryBefore = residentMemory()
+    start = time.perf_counter()
+    diskConnection = sqlite3.connect(path)
+    memoryConnection = sqlite3.connect(':memory:', factory=HotConnection)
+    diskConnection.backup(memoryConnection) # Copy every page of the database file into memory.
+    diskConnection.close()
+    seconds = time.perf_counter() - start
+    memoryAfter = residentMemory()
+    memoryConnection.diskPath = path
+    memoryConnection.loadedGeneration = databaseGeneration(memoryConnection)
+    memoryConnection.changedTables = set()
+    memoryConnection.set_authorizer(memoryConnection.recordChange)
+    return memoryConnection, seconds, None if memoryBefore is None or memoryAfter is None else memoryAfter - memoryBefore
+
+
+def openDatabase(path, hot=False):
+    '''Open a connection to a database file, or to an in-memory copy of it if hot is True.'''
+    if not hot:
+        connection = sqlite3.connect(path)
+        connection.execute("PRAGMA journal_mode = WAL;") # Readers are not blocked by writers (the setting is kept in the file).
+        return connection
+    print("Hot mode. Copying '{}' into memory...".format(path))
+    connection, seconds, memoryUsed = loadIntoMemory(path)
+    print("     Loaded in {:.3f} seconds.".format(seconds))
+    print("     Memory used: {}.".format('unknown' if memoryUsed is None else '{:.1f} MB'.format(memoryUsed / 1048576)))
+    return connection
+
+
+def isModified(connection):
+    '''Return True if an in-memory copy has been changed since it was loaded (rows or tables).'''
+    return bool(connection.changedTables)
+
+
+def copyToDisk(connection, name):
+    '''Replace a table (or view) in the attached database file with its in-memory version, along with its indexes and triggers. A table no longer in memory is dropped from the file.'''
+    quoted = '"{}"'.format(name.replace('"', '""'))
+    existing = connection.execute("SELECT type FROM disk.sqlite_master WHERE name = ? AND type IN ('table', 'view');", (name,)).fetchone()
+    if existing is not None:
+        connection.execute("DROP {} disk.{};".format(existing[0].upper(), quoted)) # Also drops the table's indexes and triggers.
+    definitions = connection.execute("SELECT type, sql FROM main.sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL ORDER BY type NOT IN ('table', 'view');", (name,)).fetchall()
+    for objectType, definition in definitions: # The table (or view) is created before its indexes and triggers.
+        connection.execute(createPattern.sub(r'\1disk.', definition, count=1))
+    if definitions and definitions[0][0] == 'table':
+        connection.execute("INSERT INTO disk.{0} SELECT * FROM main.{0};".format(quoted))
+
+
+def writeBack(connection):
+    '''
+    Copy the changed tables of an in-memory copy to its database file in one write transaction. Only the changed tables are written, so the other tables in the file are not rewritten.
+    Returns False (without writing anything) if the file has been rebuilt since the copy was loaded. The generation is checked inside the write transaction, so a rebuild cannot be published between the check and the copy.
+    '''
+    connection.set_authorizer(None) # Statements run from here on are not changes made by the script.
+    connection.rollback() # Only committed changes are copied (a database cannot be attached inside a transaction).
+    connection.execute("ATTACH DATABASE ? AS disk;", (connection.diskPath,))
+    try:
+        connection.execute("BEGIN IMMEDIATE;") # Take the write lock on the database file before checking its generation.
+        try:
+            if connection.execute("PRAGMA disk.user_version;").fetchone()[0] != connection.loadedGeneration:
+                connection.rollback()
+                return False
+            for name in sorted(connection.changedTables):
+                copyToDisk(connection, name)
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+    finally:
+        connection.execute("DETACH DATABASE disk;")
+    return True
+
+
+def closeDatabase(connection):
+    '''Close a connection. Committed changes to an in-memory copy are first copied back to the database file (unless the file has been rebuilt since it was loaded).'''
+    if isinstance(connection, HotConnection) and isModified(connection):
+        print("Hot mode. Writing changes back to '{}' ({})...".format(connection.diskPath, ', '.join(sorted(connection.changedTables))))
+        if writeBack(connection):
+            print("     Done.")
+        else:
+            print("     '{}' has been rebuilt since it was loaded. Changes have not been written back.".format(connection.diskPath))
+    connection.close()
+
+
+def databaseGeneration(connection):
+    '''Return the generation number of the database a connection is open on (0 if it has never been published).'''
+    return connection.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def fileGeneration(path):
+    '''Return the generation number of a database file (0 if the file does not exist).'''
+    if not os.path.isfile(path):
+        return 0
+    connection = sqlite3.connect(path)
+    try:
+        return databaseGeneration(connection)
+    finally:
+        connection.close()
+
+
+def removeDatabaseFiles(path):
+    '''Delete a database file and any journal files left beside it.'''
+    for filePath in [path, path + '-wal', path + '-shm', path + '-journal']:
+        if os.path.isfile(filePath):
+            os.remove(filePath)
+
+
+def publishDatabase(buildPath, path):
+    '''
+    Replace the database at path with a completed build (at buildPath) and delete the build file. Returns the new generation number.
+    If path does not exist yet, the build file is renamed into place. Otherwise its pages are copied over the existing file in a single write transaction (using the sqlite backup API), as renaming over a file in WAL mode while other scripts have it open would separate them from its log file.
+    '''
+    generation = fileGeneration(path) + 1
+    buildConnection = sqlite3.connect(buildPath)
+    buildConnection.execute("PRAGMA user_version = {:d};".format(generation))
+    buildConnection.execute("PRAGMA journal_mode = WAL;")
+    if not os.path.isfile(path):
+        buildConnection.close()
+        removeDatabaseFiles(path) # Remove any log files left by a deleted database (they would be applied to the new file).
+        os.replace(buildPath, path)
+        return generation
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute("PRAGMA journal_mode = WAL;")
+        buildConnection.backup(connection) # All pages are copied in one step, so readers see either the previous generation or the new one.
+        connection.execute("PRAGMA wal_checkpoint(PASSIVE);")
+    finally:
+        connection.close()
+        buildConnection.close()
+    removeDatabaseFiles(buildPath)
+    return generation
+
+
+def reopenIfRebuilt(connection, path, generation):
+    '''
+    For scripts that keep a database open: if the database file has been published since generation, close the connection and open the new generation (in memory again for hot mode).
+    Returns (connection, generation). Uncommitted or unsaved changes to the old connection are discarded.
+    '''
+    current = fileGeneration(path)
+    if current == generation:
+        return connection, generation
+    print("'{}' has been rebuilt since it was opened (generation {}). Reopening...".format(path, current))
+    hot = isinstance(connection, HotConnection)
+    connection.close()
+    return openDatabase(path, hot), current
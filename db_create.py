@@ -3,7 +3,7 @@ World Temperature Database Creation Script
 Author: Hashim-Jones, Jake (21/09/2017)
 Version 1.0.
 
-This script creates a database (containing three tables) and imports data from three pre-created excel workbooks (file names are outlined in readme.txt). The database is stored locally (as Temperature_Data.db) and runs via the sqlite DBMS. The database is also indexed to provide optimum speeds when running the rest of the scripts in the set.
+This script creates a database (see schema_temp.py for the layout) and imports data from three pre-created excel workbooks (file names are outlined in readme.txt). The database is stored locally (as Temperature_Data.db) and runs via the sqlite DBMS. Spreadsheet rows are validated in batches (using validate_temp.py) and any invalid rows are added to a 'Quarantine' table instead of stopping the import. The new database is built in a separate file and only replaces 'Temperature_Data.db' once it is complete, so the other scripts can keep reading the existing data while it is built (see database_temp.py). The monthly records are clustered by series, year and month to provide optimum speeds when running the rest of the scripts in the set.
 
 See readme for more details.
 '''
@@ -17,6 +17,10 @@ import sqlite3
 import openpyxl
 from os.path import isfile
 import datetime
+import validate_temp
+import schema_temp
+import shard_temp
+import database_temp
 
 def yesNoInput(prompt=""):
     while True:
@@ -26,6 +30,20 @@ def yesNoInput(prompt=""):
         print("Error! Please enter 'Y' or 'N' (case-insensitive)") # Reprompt otherwise.
     return answer == "Y" # Return True if the user input 'Y' (meaning yes), or False if the user input 'N'.
 
+dimensionIds = schema_temp.newDimensionCache() # Ids of countries, states and cities already added to the database.
+
+def loadTable(tableName, worksheet):
+    counts = {'Inserted': 0} # Number of rows added to the table and number of rows quarantined (by reason code).
+    seenKeys = set() # Primary keys already added to the table (used to detect duplicate records).
+    for firstRow, batch in validate_temp.readBatches(worksheet):
+        cleanRows, rejectedRows = validate_temp.validateBatch(tableName, firstRow, batch, seenKeys) # Check each batch of rows before adding it to the database.
+        schema_temp.insertFacts(dbCursor, tableName, cleanRows, dimensionIds) # Add all valid rows in the batch to the fact table.
+        dbCursor.executemany("Insert Into Quarantine Values (?,?,?,?);", rejectedRows) # Add all invalid rows in the batch to the 'Quarantine' table.
+        counts['Inserted'] += len(cleanRows)
+        for row in rejectedRows:
+            counts[row[2]] = counts.get(row[2], 0) + 1
+    return counts
+
 ################################
 ## Create Database Connection ##
 ################################
@@ -36,34 +54,31 @@ if isfile("Temperature_Data.db"): # Check for if the file exists already or not.
     if not databaseAlreadyExists:
         exit(0)
 
-dbConnection = sqlite3.connect("Temperature_Data.db") # Open connection to a new database file (or an existing one if it already exists).
-print("\nOpening 'Temperature_Data.db'")
-print("Connected to database.", datetime.datetime.now(),"\nSqlite version:", sqlite3.sqlite_version, "\n")
-dbCursor = dbConnection.cursor() # Create cursor object.
-
 if databaseAlreadyExists: # Only execute this branch if the database already exists...
-    print("Checking Tables\n")
-    existingTables = dbCursor.execute("Select Name From sqlite_master Where type = 'table';").fetchall() # Retrieve all table names from the database.
+    print("\nChecking Tables\n")
+    liveConnection = database_temp.openDatabase("Temperature_Data.db") # The existing database is only read here. It is not changed until the new one is complete.
+    existingTables = liveConnection.execute("Select Name From sqlite_master Where type In ('table', 'view') And Name Not Like 'sqlite_%';").fetchall() # Retrieve all table (and view) names from the database.
+    liveConnection.close()
     if len(existingTables) != 0:
         print("The following tables already exist...")
         for table in existingTables:
             print("     {}".format(table[0])) # Display list of existing table names to user.
-        print("\nContinuing will override these tables. This action cannot be undone.")
-        if yesNoInput("Are you sure you would like to continue (Y/N)? "): # Gives user the option to abort the script.
-            print("\n")
-            for table in existingTables:
-                print("Dropping Table - {}".format(table[0])) 
-                dbCursor.execute('Drop Table "{}";'.format(table[0])) # Drop ALL tables in the database already.
-            if len(dbCursor.execute("Select Name From sqlite_master Where type = 'table';").fetchall()) == 0: # Check that table dropping has been successful.
-                print("\nTables Successfully Dropped.\n")
-        else:
-            print("Disconnecting from the database...")
-            dbConnection.close() # Close the database connection.
-            print("Disconnected from the database.", datetime.datetime.now())
+        print("\nContinuing will override these tables once the new database has been built. This action cannot be undone.")
+        if not yesNoInput("Are you sure you would like to continue (Y/N)? "): # Gives user the option to abort the script.
             exit(0)
+        print("\n")
     else:
         print("'Temperature_Data.db' does not contain any tables.Continuing program.\n\n")
 
+# The new database is built in a separate file, so scripts reading 'Temperature_Data.db' can keep running (on the existing data) until it is complete.
+buildPath = "Temperature_Data.db" + database_temp.BUILD_SUFFIX
+database_temp.removeDatabaseFiles(buildPath) # Remove any incomplete build left by an earlier run.
+dbConnection = sqlite3.connect(buildPath) # Open connection to a new database file.
+dbConnection.execute("PRAGMA journal_mode = OFF;") # The build file is not used until it is complete, so no rollback journal is needed.
+print("Building new database in '{}'".format(buildPath))
+print("Connected to database.", datetime.datetime.now(),"\nSqlite version:", sqlite3.sqlite_version, "\n")
+dbCursor = dbConnection.cursor() # Create cursor object.
+
 ###################################
 ## Import Data From Spreadsheets ##
 ###################################
@@ -119,105 +134,52 @@ print("Success.\n")
 ## Create Database Tables ##
 ############################
 
-#Create table for data in 'GlobalLandTemperaturesByCountry.xlsx'.
-titles=[]
-for row in temperatureByCountryWS.iter_rows(max_row=temperatureByCountryWS.min_row, max_col=temperatureByCountryWS.max_column):
-    for cell in row:
-        titles.append(cell.value) # Import attribute names directly from spreadsheet headings.
-        
-temperatureByCountryTable = """
-Create Table Country(
-    {attr1} Date,
-    {attr2} Decimal,
-    {attr3} Decimal,
-    {attr4} Varchar2(30),
-    CONSTRAINT country_PK Primary Key ({attr1},{attr4})
-);
-""".format(attr1=titles[0], attr2=titles[1], attr3=titles[2], attr4=titles[3]) # Schema for the 'Country' table.
-
-dbCursor.execute(temperatureByCountryTable) # Add 'Country' table to the database.
-print("\n'Country' Table has been created!")
-
-#Create table for data in 'GlobalLandTemperaturesByMajorCity.xlsx'
-titles=[]
-for row in temperatureByMajorCityWS.iter_rows(max_row=temperatureByMajorCityWS.min_row, max_col=temperatureByMajorCityWS.max_column):
-    for cell in row:
-        titles.append(cell.value) # Import attribute names directly from spreadsheet headings.
-        
-temperatureByMajorCityTable = """
-Create Table MajorCity(
-    {attr1} Date,
-    {attr2} Decimal,
-    {attr3} Decimal,
-    {attr4} Varchar2(30),
-    {attr5} Varchar2(30),
-    {attr6} Varchar2(9),
-    {attr7} Varchar2(9),
-    CONSTRAINT majorcity_PK Primary Key ({attr1},{attr4},{attr5})
-);
-""".format(attr1=titles[0], attr2=titles[1], attr3=titles[2], attr4=titles[3], attr5=titles[4], attr6=titles[5], attr7=titles[6]) # Schema for the 'MajorCity' table.
-
-dbCursor.execute(temperatureByMajorCityTable) # Add 'MajorCity' table to the database.
-print("'MajorCity' Table has been created!")
-
-
-#Create table for data in 'GlobalLandTemperaturesByState.xlsx'
-titles = []
-for row in temperatureByStateWS.iter_rows(max_row=temperatureByStateWS.min_row,
-                                              max_col=temperatureByStateWS.max_column):
-    for cell in row:
-        titles.append(cell.value) # Import attribute names directly from spreadsheet headings.
-
-temperatureByStateTable = """
-Create Table State(
-    {attr1} Date,
-    {attr2} Decimal,
-    {attr3} Decimal,
-    {attr4} Varchar2(30),
-    {attr5} Varchar2(30),
-    CONSTRAINT state_PK Primary Key ({attr1},{attr4},{attr5})
-);
-""".format(attr1=titles[0], attr2=titles[1], attr3=titles[2], attr4=titles[3], attr5=titles[4]) # Schema for the 'State' table.
-
-dbCursor.execute(temperatureByStateTable) # Add 'State' table to the database.
-print("'State' Table has been created!\n")
+# Names and coordinates are stored once in dimension tables and monthly records are stored in fact tables (clustered by series, year and month). The original 'Country', 'MajorCity' and 'State' tables are created as views over these tables (see schema_temp.py).
+titles={}
+for tableName, worksheet in [('Country', temperatureByCountryWS), ('MajorCity', temperatureByMajorCityWS), ('State', temperatureByStateWS)]:
+    titles[tableName]=[]
+    for row in worksheet.iter_rows(max_row=worksheet.min_row, max_col=worksheet.max_column):
+        for cell in row:
+            titles[tableName].append(cell.value) # Import attribute names directly from spreadsheet headings.
+
+schema_temp.createCompactSchema(dbCursor, titles) # Add dimension tables, fact tables and views to the database.
+print("\n'DimCountry', 'DimState' and 'DimCity' Tables have been created!")
+print("'FactCountry', 'FactState' and 'FactCity' Tables have been created!")
+print("'Country', 'MajorCity' and 'State' Views have been created!\n")
 
 
 ##########################################
 ## Add Excel Data From Each Spreadsheet ##
 ##########################################
 
-print("Addding data to 'Country' table...")
-for line in temperatureByCountryWS.iter_rows(min_row=2, max_row=temperatureByCountryWS.max_row, max_col=temperatureByCountryWS.max_column):
-    row=[cell.value if cell.value != None else 'Null' for cell in line ] # Add null for missing data values.
-    dbCursor.execute('Insert Into Country Values ("{Date}",{AverageTemperature},{AverageTemperatureUncertainty},"{Country}");'.format(Date=row[0], AverageTemperature=row[1], AverageTemperatureUncertainty=row[2], Country=row[3])) # Add each row to the 'Country' table in the database
-print("Done.\n")
-
-print("Addding data to 'MajorCity' table...")
-for line in temperatureByMajorCityWS.iter_rows(min_row=2, max_row=temperatureByMajorCityWS.max_row, max_col=temperatureByMajorCityWS.max_column):
-    row=[cell.value if cell.value != None else 'Null' for cell in line ] # Add null for missing data values.
-    dbCursor.execute('Insert Into MajorCity Values ("{Date}",{AverageTemperature},{AverageTemperatureUncertainty},"{City}", "{Country}", "{Latitude}", "{Longitude}");'.format(Date=row[0], AverageTemperature=row[1], AverageTemperatureUncertainty=row[2], City=row[3], Country=row[4], Latitude=row[5], Longitude=row[6])) # Add each row to the 'MajorCity' table in the database.
-print("Done.\n")
-
-print("Addding data to 'State' table...")
-for line in temperatureByStateWS.iter_rows(min_row=2, max_row=temperatureByStateWS.max_row, max_col=temperatureByStateWS.max_column):
-    row=[cell.value if cell.value != None else 'Null' for cell in line ] # Add null for missing data values.
-    dbCursor.execute('Insert Into State Values ("{Date}",{AverageTemperature},{AverageTemperatureUncertainty},"{State}", "{Country}");'.format(Date=row[0], AverageTemperature=row[1], AverageTemperatureUncertainty=row[2], State=row[3], Country=row[4])) # Add each row to the 'State' table in the database.
-print("Done.\n")
+# Rows are validated and inserted in batches. Rows that fail validation are added to the 'Quarantine' table (with a reason code) rather than stopping the import.
+dbCursor.execute(validate_temp.quarantineTable) # Add 'Quarantine' table to the database.
+print("'Quarantine' Table has been created!\n")
+
+importCounts = {}
+for tableName, worksheet in [('Country', temperatureByCountryWS), ('MajorCity', temperatureByMajorCityWS), ('State', temperatureByStateWS)]:
+    print("Addding data to '{}' table...".format(tableName))
+    importCounts[tableName] = loadTable(tableName, worksheet)
+    print("     {} rows added. {} rows quarantined.".format(importCounts[tableName]['Inserted'], sum(importCounts[tableName].values()) - importCounts[tableName]['Inserted']))
+    print("Done.\n")
+
+print("Import summary...")
+for tableName in importCounts:
+    print("     {}".format(tableName))
+    for reason in ['Inserted'] + validate_temp.REASON_CODES:
+        if importCounts[tableName].get(reason, 0) > 0:
+            print("          {}: {}".format(reason, importCounts[tableName][reason])) # Display the number of rows added and the number of rows quarantined for each reason.
+if sum(sum(counts.values()) - counts['Inserted'] for counts in importCounts.values()) > 0:
+    print("Warning! Some rows could not be imported. These rows have been added to the 'Quarantine' table.")
+print("\n")
 
 ###########################################
 ## Index Database to Improve Performance ##
 ###########################################
 
-#Optimizes the database for the queries performed by the set of scripts. Indexed attributes are the ones that appear in the 'WHERE' clause of SQL queries. NOTE: This is done AFTER the data has been insesrted as indexing will slow down future data insertion.
-print("Optimizing database by performing indexing...")
-dbCursor.execute("CREATE INDEX i_state_country ON State(Country);")
-dbCursor.execute("CREATE INDEX i_state_state ON State(State);")
-dbCursor.execute("CREATE INDEX i_state_date ON State(date);")
-dbCursor.execute("CREATE INDEX i_majorcity_country ON MajorCity(Country);")
-dbCursor.execute("CREATE INDEX i_majorcity_latitude ON MajorCity(Latitude);")
-dbCursor.execute("CREATE INDEX i_majorcity_date ON MajorCity(date);")
-dbCursor.execute("CREATE INDEX i_country_country ON Country(country);")
+#Optimizes the database for the queries performed by the set of scripts. The fact tables do not need any further indexes as they are already clustered by series, year and month (the dimension tables are indexed by their unique constraints). Collecting statistics allows the query planner to choose the best join order for the views.
+print("Optimizing database by analyzing tables...")
+dbCursor.execute("ANALYZE;")
 print("Done.")
 
 ##################################################
@@ -230,3 +192,23 @@ print("Success.\n")
 print("Disconnecting from the database...")
 dbConnection.close() # Close the connection.
 print("Disconnected from the database.",datetime.datetime.now())
+
+##############################
+## Publish the New Database ##
+##############################
+
+# The completed database replaces 'Temperature_Data.db' in a single step. Scripts part way through a query finish it on the previous data (see database_temp.py).
+print("\nPublishing '{}' as 'Temperature_Data.db'...".format(buildPath))
+generation = database_temp.publishDatabase(buildPath, "Temperature_Data.db")
+print("Success. Database generation {}.".format(generation), datetime.datetime.now())
+
+##########################################
+## Build Sharded Copy (Optional Layout) ##
+##########################################
+
+# The sharded layout partitions the records by country into several database files, so that queries over many countries can be run on several cores (see shard_temp.py). 'Temperature_Data.db' is still used by the rest of the scripts in the set.
+if yesNoInput("\nWould you like to also build a sharded copy of the database ({} files) (Y/N)? ".format(shard_temp.SHARD_COUNT)):
+    print("\nPartitioning records by country...")
+    for path in shard_temp.buildShards("Temperature_Data.db", shard_temp.SHARD_COUNT):
+        print("     Created '{}'.".format(path)) # Display the name of each shard file.
+    print("Success.", datetime.datetime.now())
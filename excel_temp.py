@@ -3,7 +3,7 @@ World Temperature Database Chinese Cities Data Processing Script
 Author: Hashim-Jones, Jake (21/09/2017)
 Version 1.0.
 
-This script creates a connection to the database created by db_create.py. It then queries the database for average annual temperature data from all major cities in China. It then processes this data and exports it to a spreadshxeet in an excel workbook ('World Temperatures.xlsx') and creates a line chart (also saved in the spreadsheet).
+This script creates a connection to the database created by db_create.py. It then queries the database for average annual temperature data from all major cities in China. It then streams this data (see stream_temp.py) to a spreadshxeet in an excel workbook ('World Temperatures.xlsx') and creates a line chart (also saved in the spreadsheet).
 
 See readme for more details.
 '''
@@ -19,6 +19,9 @@ from openpyxl.styles import (Font, Alignment, PatternFill, Color, Border, Side)
 import sqlite3
 from os.path import isfile
 import datetime
+import database_temp
+import stream_temp
+import xlsx_temp
 
 def yesNoInput(prompt=""):
     while True:
@@ -36,13 +39,14 @@ if not isfile("Temperature_Data.db"): # Check that database file exists...
     print("Error, 'Temperature_Data.db' does not exist. Please run 'db_create.py' first.") # Prompt to run the creation script if it does not.
     exit(0)
 
-dbConnection = sqlite3.connect("Temperature_Data.db") # Open connection to the (existing) database.
+dbConnection = database_temp.openDatabase("Temperature_Data.db", database_temp.hotModeRequested()) # Open connection to the (existing) database (or to an in-memory copy of it in hot mode).
+dbGeneration = database_temp.databaseGeneration(dbConnection) # Generation number of the database when it was opened.
 print("\nOpening 'Temperature_Data.db'")
 print("Connected to database.", datetime.datetime.now(),"\nSqlite version:", sqlite3.sqlite_version, "\n")
 dbCursor = dbConnection.cursor() # Create cursor object.
 
 print("Checking Tables...\n")
-existingTables = dbCursor.execute("Select Name From sqlite_master Where type = 'table';").fetchall() # Obtaining table names that exist in the database.
+existingTables = dbCursor.execute("Select Name From sqlite_master Where type In ('table', 'view');").fetchall() # Obtaining table (and view) names that exist in the database.
 existingTables = [name[0] for name in existingTables] # Extracting table names from the database output.
 missingTables = [name for name in ['Country', 'MajorCity', 'State'] if name not in existingTables] # Compile list of 'expected' tables in the database that are NOT present.
 
@@ -51,7 +55,7 @@ if len(missingTables) >0: # This branch is executed if the database is mising on
         print("'{}' Table is missing.".format(name)) # Alert user that table(s) are missing.
     print("\nError, 'Temperature_Data.db has incomplete data. Please run 'db_create.py' to ensure all appropriate data is available for the program.\n") # Prompt user to run the creation script.
     print("Disconnecting from the database...")
-    dbConnection.close() # Close the database connection.
+    database_temp.closeDatabase(dbConnection) # Close the database connection.
     print("Disconnected from the database.", datetime.datetime.now())
     exit(0) # Terminate the program.
 else: # Everything is fine and the program continues.
@@ -65,29 +69,23 @@ if isfile("World Temperature.xlsx"): # Check if workbook already exists. If it d
     if not yesNoInput("Warning! Workbook 'World Temperature.xlsx' already exists. Continuing modify this workbook. Do you wish to continue (Y/N)?"): # If workbook does exist, warn user and give option to abort.
         exit(0)
     else:
-        print("\nOpening Workbook...")
-        worldTempWB = openpyxl.load_workbook("World Temperature.xlsx") # Load existing workbook.
-        print("Success.\n")
-        print("Checking existing sheets...\n")
-        sheets = worldTempWB.get_sheet_names() # Retrieve a list of sheet names from the existing workbook.
+        print("\nChecking existing sheets...\n")
+        sheets = xlsx_temp.sheetNames("World Temperature.xlsx") # Read the list of sheet names only (the rest of the workbook is not opened).
         if "Temperature by City" in sheets: # Determine if the sheet 'Temperature by City' sheet already exists. The following branch is executed if it does exist.
             if not yesNoInput("Warning! 'Temperature by City' is already in the workbook sheets. Continuing will replace the data in this sheet. Do you wish to continue (Y/N)? "): # Warn user and give the option to abort the script.
                 exit(0)
-            else:
-                print("\nRemoving sheet 'Temperature by City'...")
-                sheetToRemove = worldTempWB.get_sheet_by_name("Temperature by City") # Obtain existing 'Temperature by City' sheet.
-                worldTempWB.remove(sheetToRemove) # Delete existing 'Temperature by City' sheet.
-                print("Success.\n")
+            print("\nThe existing sheet 'Temperature by City' will be replaced when the workbook is saved.\n")
         else: # If 'Temperature by City' sheet does not already exist, continue the program.
             print("No conflicting sheets.\n")
-else: # Workbook does not exist already.
-    print("Creating new workbook...")
-    worldTempWB = openpyxl.Workbook() # Create new workbook.
-    print("Success.\n")
-    print("Cleaning new workbook file...")
-    defaultSheet = worldTempWB.get_sheet_by_name("Sheet") # Obtain default sheet.
-    worldTempWB.remove(defaultSheet) # Remove default sheet.
-    print("Success. Removed all default material.\n")
+
+# The sheet is created in a new workbook. If 'World Temperature.xlsx' already exists, only this sheet is added to it when it is saved (see xlsx_temp.py), so the other sheets in the workbook are not loaded or rewritten.
+print("Creating new workbook...")
+worldTempWB = openpyxl.Workbook() # Create new workbook.
+print("Success.\n")
+print("Cleaning new workbook file...")
+defaultSheet = worldTempWB.get_sheet_by_name("Sheet") # Obtain default sheet.
+worldTempWB.remove(defaultSheet) # Remove default sheet.
+print("Success. Removed all default material.\n")
 
 print("Creating Worksheet 'Temperature by City'...")
 worldTempWS = worldTempWB.create_sheet("Temperature by City") # Create new worksheet called 'Temperature by City'.
@@ -97,61 +95,47 @@ print("Success.\n\n")
 ## Query the Database ##
 ########################
 
+dbConnection, dbGeneration = database_temp.reopenIfRebuilt(dbConnection, "Temperature_Data.db", dbGeneration) # Reopen the database if db_create.py has replaced it while waiting for the user.
+dbCursor = dbConnection.cursor()
+
 print("Obtaining temperature data from major Chinese cities...\n")
 print("Warning! Some data may missing. These will not be counted in the calculated averages.\n")
-data=dbConnection.execute('''
-SELECT SUBSTR(date, 0, 5) As Year, City, AVG(AverageTemperature) 
+cities=[entry[0] for entry in dbConnection.execute('''
+SELECT DISTINCT City
+FROM MajorCity
+WHERE Country='China'
+ORDER BY City;
+''').fetchall()] # Query the database and obtain a list of all city names in China (these are the columns of the spreadsheet).
+dbCursor.execute('''
+SELECT printf('%04d', Year), City, AVG(AverageTemperature) 
 FROM MajorCity
 WHERE Country='China'
 GROUP BY Year, City
 ORDER BY Year, City;
-''').fetchall() # Query the database to retrieve city temperature data for all cities in China.
-print("Data retrieved.\n\n")
-
-###############################
-## Close Database Connection ##
-###############################
-
-print("Disconnecting from the database...")
-dbConnection.close() # Close database connection.
-print("Disconnected from the database.", datetime.datetime.now(), "\n\n")
+''') # Query the database to retrieve city temperature data for all cities in China. The rows are fetched as they are added to the spreadsheet.
+print("Query complete.\n\n")
 
 ###########################
 ## Add Data to Worksheet ##
 ###########################
 
-cities={}
-records={}
-print("Compiling data...\n")
-for record in data:
-    records[record[0]] = records.get(record[0], []) + [(record[1], record[2])] # Adds records if to dictionary (key is the year and the value is a tuple of city and average temperature).
-    cities[record[1]] = cities.get(record[1], 0) + 1 # Generates a dictionary of ALL city names (for buffering later on).
+# The rows are streamed from the database to the spreadsheet (one chunk at a time). Each year becomes one row of the spreadsheet, and a city that does not have a record for a year (ie. there wasn't even an empty record for that city) is added as a blank cell.
 print("Warning! Some of the data may be missing for average annual temperature. These values will be added as blank cells.")
-# City names will automatically be in the order of the number of records due to the way that the sql query returns data (and the processing above).
-citylist = list(cities.keys())
-
-# The following loop essentially adds an empty value for a city (with a temperature of None), if that city was not returned from the original query (ie. there wasn't even an empty record for that city).
-for record in records:
-    newRecordEntries = [(city, None) for city in citylist] # Generates a list of 'placeholder' records (this gives appropriate empty space buffers when adding data to the excel sheet).
-    newRecordKeys={}
-    for item in newRecordEntries: # Adds records to a dictionary as keys.
-        newRecordKeys[item]=True
-    for item in records[record]: # Replaces placeholder records if actual data record exists.
-        if (item[0], None) in newRecordKeys.keys():
-            del newRecordKeys[(item[0], None)] # Remove placeholder record
-            newRecordKeys[(item[0], item[1])] = True # Add actual data in its place.
-    records[record] = sorted(list(newRecordKeys.keys())) # Sort the records by city.
-print("Complete.\n")
-
-# The following loop generates the rows and adds them to the spreadsheet.
 print("Generating rows and adding to spreadsheet...")
-worldTempWS.append(['Year'] + sorted(list(cities.keys()))) # Add header row to spreadsheet
-for year in records:
-     temperatures = [record[1] for record in records[year]] # Compile row for spreadsheet.
-     worldTempWS.append([year] + temperatures) # Add row to spreadsheet.
-     print("     Added temperature data for {}".format(year))
+worldTempWS.append(['Year'] + cities) # Add header row to spreadsheet
+streamCounts={} # Number of rows processed by each stage of the pipeline.
+stream_temp.writeWorksheet(worldTempWS, stream_temp.pivotRows(stream_temp.readRows(dbCursor, stream_temp.CHUNK_SIZE, streamCounts), cities, streamCounts), streamCounts) # Fetch query results, compile one row per year and add each row to the spreadsheet.
+stream_temp.reportCounts(streamCounts)
 print("Success. All data has been added to the spreadsheet.\n\n")
 
+###############################
+## Close Database Connection ##
+###############################
+
+print("Disconnecting from the database...")
+database_temp.closeDatabase(dbConnection) # Close database connection.
+print("Disconnected from the database.", datetime.datetime.now(), "\n\n")
+
 #####################################
 ## Formatting the Spreadsheet Data ##
 #####################################
@@ -229,7 +213,7 @@ print("Success.\n\n")
 print("Saving changes...")
 if isfile("World Temperature.xlsx"): # If workbook already exists...
     if yesNoInput("Are you sure you would like to save changes to 'World Temperature.xlsx'? This action cannot be undone (Y/N). "): # Give user the option to save changes.
-        worldTempWB.save("World Temperature.xlsx") # Save changes.
+        xlsx_temp.replaceSheet("World Temperature.xlsx", worldTempWB, "Temperature by City") # Replace (or add) only this sheet in the existing workbook.
         print("\nChanges have been saved.")
     else:
         print("\nChanges have not been saved.")
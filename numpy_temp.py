@@ -3,7 +3,7 @@ World Temperature Database Australian State Temperature Data Processing Script
 Author: Hashim-Jones, Jake (21/09/2017)
 Version 1.0.
 
-This script creates a connection to the database created by db_create.py. It then queries the database for average annual temperature data states in Australia (and for the nation itself) AND calculates the differences between each state and the national data (for each year). It then processes this data and exports it to a spreadshxeet in an excel workbook ('World Temperatures.xlsx'). This data is plotted (using matplotlib) and shown on screen in a seperate new window.
+This script creates a connection to the database created by db_create.py. It then queries the database for average annual temperature data states in Australia (and for the nation itself) AND calculates the differences between each state and the national data (for each year), along with a moving average and decade averages of these differences. It then processes this data and exports it to a spreadshxeet in an excel workbook ('World Temperatures.xlsx'). This data is plotted (using matplotlib) and shown on screen in a seperate new window.
 
 See readme for more details.
 '''
@@ -15,11 +15,16 @@ See readme for more details.
 print("Initializing.\n")
 import openpyxl
 from openpyxl.styles import (Font, Alignment, PatternFill, Color, Border, Side)
+from openpyxl.utils import get_column_letter
 import sqlite3
 from os.path import isfile
 import datetime
+import database_temp
 import numpy
 import matplotlib.pyplot as plt
+import stream_temp
+import xlsx_temp
+import smooth_temp
 
 def yesNoInput(prompt=""):
     while True:
@@ -37,13 +42,14 @@ if not isfile("Temperature_Data.db"): # Check that database file exists...
     print("Error, 'Temperature_Data.db' does not exist. Please run 'db_create.py' first.") # Prompt to run the creation script if it does not.
     exit(0)
 
-dbConnection = sqlite3.connect("Temperature_Data.db") # Open connection to the (existing) database.
+dbConnection = database_temp.openDatabase("Temperature_Data.db", database_temp.hotModeRequested()) # Open connection to the (existing) database (or to an in-memory copy of it in hot mode).
+dbGeneration = database_temp.databaseGeneration(dbConnection) # Generation number of the database when it was opened.
 print("\nOpening 'Temperature_Data.db'")
 print("Connected to database.", datetime.datetime.now(),"\nSqlite version:", sqlite3.sqlite_version, "\n")
 dbCursor = dbConnection.cursor() # Create cursor object.
 
 print("Checking Tables...\n")
-existingTables = dbCursor.execute("Select Name From sqlite_master Where type = 'table';").fetchall() # Obtaining table names that exist in the database.
+existingTables = dbCursor.execute("Select Name From sqlite_master Where type In ('table', 'view');").fetchall() # Obtaining table (and view) names that exist in the database.
 existingTables = [name[0] for name in existingTables] # Extracting table names from the database output.
 missingTables = [name for name in ['Country', 'MajorCity', 'State'] if name not in existingTables] # Compile list of 'expected' tables in the database that are NOT present.
 
@@ -52,7 +58,7 @@ if len(missingTables) >0: # This branch is executed if the database is mising on
         print("'{}' Table is missing.".format(name)) # Alert user that table(s) are missing.
     print("\nError, 'Temperature_Data.db has incomplete data. Please run 'db_create.py' to ensure all appropriate data is available for the program.\n") # Prompt user to run the creation script.
     print("Disconnecting from the database...")
-    dbConnection.close() # Close the database connection.
+    database_temp.closeDatabase(dbConnection) # Close the database connection.
     print("Disconnected from the database.", datetime.datetime.now())
     exit(0) # Terminate the program.
 else: # Everything is fine and the program continues.
@@ -66,29 +72,23 @@ if isfile("World Temperature.xlsx"): # Check whether or not workbook already exi
     if not yesNoInput("Warning! Workbook 'World Temperature.xlsx' already exists. Continuing modify this workbook. Do you wish to continue (Y/N)?"): # Warn user and give option to abort the script.
         exit(0)
     else:
-        print("\nOpening Workbook...")
-        worldTempWB = openpyxl.load_workbook("World Temperature.xlsx") # Open existing workbook.
-        print("Success.\n")
-        print("Checking existing sheets...\n")
-        sheets = worldTempWB.get_sheet_names() # Obtain a list of sheet names from the workbook.
+        print("\nChecking existing sheets...\n")
+        sheets = xlsx_temp.sheetNames("World Temperature.xlsx") # Read the list of sheet names only (the rest of the workbook is not opened).
         if "Comparison" in sheets: # Look for the 'Comparison' sheet in the sheet names. This branch is executed if the sheet already exists.
             if not yesNoInput("Warning! 'Comparison' is already in the workbook sheets. Continuing will replace the data in this sheet. Do you wish to continue (Y/N)? "): # Warn user and give the option to abort the script.
                 exit(0)
-            else:
-                print("\nRemoving sheet 'Comparison'...")
-                sheetToRemove = worldTempWB.get_sheet_by_name("Comparison") # Obtain existing 'Comparison' sheet.
-                worldTempWB.remove(sheetToRemove) # Delete existing 'Comparison' sheet.
-                print("Success.\n")
+            print("\nThe existing sheet 'Comparison' will be replaced when the workbook is saved.\n")
         else: # Continue program if 'Comparison' sheet does not already exist.
             print("No conflicting sheets.\n")
-else: # Workbook does not exist already.
-    print("Creating new workbook...")
-    worldTempWB = openpyxl.Workbook() # Create new workbook.
-    print("Success.\n")
-    print("Cleaning new workbook file...")
-    defaultSheet = worldTempWB.get_sheet_by_name("Sheet") # Obtain default sheet.
-    worldTempWB.remove(defaultSheet) # Remove default sheet.
-    print("Success. Removed all default material.\n")
+
+# The sheet is created in a new workbook. If 'World Temperature.xlsx' already exists, only this sheet is added to it when it is saved (see xlsx_temp.py), so the other sheets in the workbook are not loaded or rewritten.
+print("Creating new workbook...")
+worldTempWB = openpyxl.Workbook() # Create new workbook.
+print("Success.\n")
+print("Cleaning new workbook file...")
+defaultSheet = worldTempWB.get_sheet_by_name("Sheet") # Obtain default sheet.
+worldTempWB.remove(defaultSheet) # Remove default sheet.
+print("Success. Removed all default material.\n")
 
 print("Creating Worksheet 'Comparison'...")
 worldTempWS = worldTempWB.create_sheet("Comparison") # Create new worksheet called 'Comparison'.
@@ -98,42 +98,38 @@ print("Success.\n\n")
 ## Query the Database ##
 ########################
 
+dbConnection, dbGeneration = database_temp.reopenIfRebuilt(dbConnection, "Temperature_Data.db", dbGeneration) # Reopen the database if db_create.py has replaced it while waiting for the user.
+dbCursor = dbConnection.cursor()
+
 print("Obtaining temperature data from Australian states...")
 
 
 statenames=[entry[0] for entry in dbConnection.execute('''
 SELECT DISTINCT State 
 From State
-WHere Country='Australia';
+WHere Country='Australia'
+ORDER BY State;
 ''').fetchall()] # Query the database and obtain a list of all possible state names in Australia.
 print("     Retrieved state names.")
 
-stateData={}
-years={}
-for state in statenames: # This loop retrieves data from individual states based on the state names retrieved above.
-    result = dbConnection.execute('''
-    SELECT CAST(SUBSTR(date, 0, 5) As INTEGER) As Year, AVG(AverageTemperature) 
-    FROM State
-    WHERE Country='Australia'
-        AND State='{}'
-    GROUP BY Year, State
-    ORDER BY Year, State;
-    '''.format(state)).fetchall() # Query the database to retrieve relevant data for each state in Australia (from the 'State' table).
-    for record in result: # Notes all the years found across all data.
-        years[record[0]]=True
-    stateData[state]=result # Adds each data set to a dictionary as a list (the state names are the keys).
-    print("     Retrieved data for {}.".format(state))
-
-result=dbConnection.execute('''
-SELECT CAST(SUBSTR(date, 0, 5) As INTEGER) As Year, AVG(AverageTemperature) 
+dbCursor.execute('''
+SELECT Year, State, AVG(AverageTemperature) 
+FROM State
+WHERE Country='Australia'
+GROUP BY Year, State
+UNION ALL
+SELECT Year, 'Australia', AVG(AverageTemperature) 
 FROM Country
 WHERE Country='Australia'
-GROUP BY Year;
-''').fetchall() # Queries the database to retrieve all national average data (from the 'Country' table).
-print("     Retrieved national temperature data.")
-stateData['Australia'] = result # Adds retrieved data to a new entry in the data dictionary under the 'Australia' key.
-for record in result:  # Notes all the years found across all data.
-    years[record[0]] = True
+GROUP BY Year
+ORDER BY Year;
+''') # Query the database to retrieve data for each state in Australia (from the 'State' table) and all national average data (from the 'Country' table), ordered by year.
+
+# The rows are streamed from the database into an ndarray (one chunk at a time). Each year becomes one row of the array and each state (and the nation) becomes one column. Years where a state does not have a record (ie. there is not even an empty record) are added as None, which is evaluated to nan in the array.
+seriesNames = statenames + ['Australia'] # The national data is the last column.
+streamCounts={} # Number of rows processed by each stage of the pipeline.
+years, temperatureArray = stream_temp.buildArray(stream_temp.pivotRows(stream_temp.readRows(dbCursor, stream_temp.CHUNK_SIZE, streamCounts), seriesNames, streamCounts), len(seriesNames), streamCounts)
+stream_temp.reportCounts(streamCounts)
 print("Success.\n\n")
 
 ###############################
@@ -141,7 +137,7 @@ print("Success.\n\n")
 ###############################
 
 print("Disconnecting from the database...")
-dbConnection.close() # Disconnect from the database.
+database_temp.closeDatabase(dbConnection) # Disconnect from the database.
 print("Disconnected from the database.",datetime.datetime.now(), "\n\n")
 
 #####################
@@ -149,25 +145,27 @@ print("Disconnected from the database.",datetime.datetime.now(), "\n\n")
 #####################
 print("Processing data...")
 
-# The following loop adds None values for years where the data is missing (even in cases where the year was not returned by the query).
-for record in stateData:
-    newRecordEntries = [(year, None) for year in years] # Generates blank list of tuples containing all possible years retrieved with null values. These are simply placeholders.
-    newRecordKeys={}
-    for item in newRecordEntries: # Compiles dictionary containing all placeholder tuples generated previously
-        newRecordKeys[item]=True
-    for item in stateData[record]: # This loop replaces place holder tuples in the dictionary with data from the database if it is present.
-        if (item[0], None) in newRecordKeys.keys():
-            del newRecordKeys[(item[0], None)] # Remove placeholder tuple.
-            newRecordKeys[(item[0], item[1])] = True # Add data tuple from database.
-    newRecord = sorted(list(newRecordKeys.keys())) # Obtain list from dictionary keys (ordered by year).
-    arrayData = [temperature[1] for temperature in newRecord] # Compile a list of temperatures without year (still ordered by year).
-    stateData[record] = numpy.array(arrayData, dtype=float) # Convert list to an ndarray.
+stateData={}
+for position, name in enumerate(seriesNames):
+    stateData[name] = temperatureArray[:, position] # Adds each data set to a dictionary as an ndarray (ordered by year, the state names are the keys).
 
 differences={}
 for state in stateData:
     if state=='Australia':
         continue
     differences[state]=stateData[state]-stateData['Australia'] # Calculate a new set of data which are the differences between each state data set and the national data set (each result is added to a new dictionary.
+
+# The following calculates a centred moving average of each state's difference data (to show the trend through the year-to-year noise). Years that were not returned by the query are filled with nan first, so every window covers the same number of years. An average is only given where at least half of the window has data (see smooth_temp.py).
+MOVING_AVERAGE_WINDOW = 10 # Number of years in each moving average.
+differenceArray = numpy.array([differences[state] for state in differences], ndmin=2) # One row per state.
+allYears, filledDifferences, yearPositions = smooth_temp.fillSteps(years, differenceArray)
+smoothedArray = smooth_temp.movingAverage(filledDifferences, MOVING_AVERAGE_WINDOW, centered=True)[:, yearPositions] # Keep only the years that are in the spreadsheet.
+smoothedDifferences = {state: smoothedArray[position] for position, state in enumerate(differences)}
+
+# The following calculates the average of each state's difference data for each decade (eg. 1850 to 1859). In the spreadsheet each year shows the average of its decade.
+decadeStarts, decadeArray = smooth_temp.decadeAverages(allYears, filledDifferences)
+decadePositions = [decadeStarts.index(year - year % 10) for year in years] # Decade of each year in the spreadsheet.
+decadeDifferences = {state: decadeArray[position, decadePositions] for position, state in enumerate(differences)}
 print("Success.\n\n")
 
 ########################
@@ -175,13 +173,14 @@ print("Success.\n\n")
 ########################
 
 print("Generating plot...")
-y = list(years.keys()) # Defining the x-axis
+y = years # Defining the x-axis
 
 # The following creates a new figure and adds each data set (from differences) as a new subplot on the figure.
 plt.figure(1)
 for state in differences:
     plt.subplot(111) # Add new subplot.
-    plt.plot(y, differences[state], linestyle=' ', marker='.', label=state) # Plot each state's difference data.
+    points, = plt.plot(y, differences[state], linestyle=' ', marker='.', label=state) # Plot each state's difference data.
+    plt.plot(y, smoothedDifferences[state], linestyle='-', color=points.get_color()) # Plot each state's moving average (as a line in the same colour).
 print("Success.\n")
 
 #The following formats the figure to make it more presentable aesthetically.
@@ -189,7 +188,7 @@ plt.axhline(y=0, color='k', linestyle='-') # Flat line for y=0.
 print("Adding titles and legends to plot...")
 plt.legend()
 plt.grid(True, which='both', linestyle='--')
-plt.title("Differences in State Average Annual Temperature With National Average Annual Temperature")
+plt.title("Differences in State Average Annual Temperature With National Average Annual Temperature\n(Lines Show {}-Year Moving Averages)".format(MOVING_AVERAGE_WINDOW))
 plt.xlabel("Year")
 plt.ylabel(u"Difference Between State and National Average Annual Temperature (\xb0C)")
 
@@ -226,6 +225,19 @@ worldTempWS.append([None]) # Add empty row.
 worldTempWS.append(["Difference Between State and National Avarage Temperature"])
 for state in differences:
     worldTempWS.append([state] + [temp if not numpy.isnan(temp) else '-' for temp in list(differences[state])]) # Add state difference data with '-' if the value is nan (not a number). Loop iterates through the states.
+worldTempWS.append([None]) # Add empty row.
+worldTempWS.append(["{}-Year Moving Average of Difference".format(MOVING_AVERAGE_WINDOW)])
+smoothedTitleRow = worldTempWS.max_row # Row number of the moving average title (for formatting).
+for state in smoothedDifferences:
+    worldTempWS.append([state] + [temp if not numpy.isnan(temp) else '-' for temp in list(smoothedDifferences[state])]) # Add state moving average data with '-' if the value is nan (not a number). Loop iterates through the states.
+worldTempWS.append([None]) # Add empty row.
+worldTempWS.append(["Decade Average of Difference"])
+decadeTitleRow = worldTempWS.max_row # Row number of the decade average title (for formatting).
+for state in decadeDifferences:
+    worldTempWS.append([state] + [temp if not numpy.isnan(temp) else '-' for temp in list(decadeDifferences[state])]) # Add state decade average data with '-' if the value is nan (not a number). Loop iterates through the states.
+lastDataRow = worldTempWS.max_row # Row number of the last data row (for formatting).
+lastDataColumn = get_column_letter(len(y) + 1) # Letter of the last data column (one column per year after the first column).
+borderColumn = get_column_letter(len(y) + 2) # Letter of the column after the last data column.
 print("Success.\n")
 
 #####################################
@@ -263,14 +275,16 @@ for row in worldTempWS.iter_rows(max_row=worldTempWS.max_row, max_col=worldTempW
             cell.border = rightBorderOnly # Add right border to first column.
         if cell.column != 'A' and cell.row != 1: # Affect all valud cells except those in the first row or column (data cells).
             cell.fill = colourDataCell # Change background colour of data cells.
-for row in worldTempWS['A24:FR24']: # Affects the row below the last data row.
+for row in worldTempWS['A{0}:{1}{0}'.format(lastDataRow + 1, lastDataColumn)]: # Affects the row below the last data row.
     for cell in row:
         cell.border = topBorderOnly # Adds border to the bottom of the data area.
-for row in worldTempWS['FS1:FS23']: # Affects the column below the last data column.
+for row in worldTempWS['{0}1:{0}{1}'.format(borderColumn, lastDataRow)]: # Affects the column below the last data column.
     for cell in row:
         cell.border = leftBorderOnly # Adds border to the right side od the data area.
 worldTempWS['A4'].font=titleFont # Add specific font to this cell.
 worldTempWS['A15'].font = titleFont # Add specific font to this cell.
+worldTempWS['A{}'.format(smoothedTitleRow)].font = titleFont # Add specific font to this cell.
+worldTempWS['A{}'.format(decadeTitleRow)].font = titleFont # Add specific font to this cell.
 print("Done.\n\n")
 #End of the formatting section
 
@@ -281,7 +295,7 @@ print("Done.\n\n")
 print("Saving changes...")
 if isfile("World Temperature.xlsx"): # If workbook already exists...
     if yesNoInput("Are you sure you would like to save changes to 'World Temperature.xlsx'? This action cannot be undone (Y/N). "): # Give user the option to save changes.
-        worldTempWB.save("World Temperature.xlsx") # Save changes.
+        xlsx_temp.replaceSheet("World Temperature.xlsx", worldTempWB, "Comparison") # Replace (or add) only this sheet in the existing workbook.
         print("\nChanges have been saved.")
     else:
         print("\nChanges have not been saved.")
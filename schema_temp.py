@@ -0,0 +1,184 @@
+'''
+World Temperature Database Schema Module
+Version 1.0.
+
+This module defines the compact storage layout of the database created by db_create.py. Country, state and city names (and city coordinates) are stored once in dimension tables with integer ids. Monthly temperature records are stored in fact tables declared WITHOUT ROWID, so that each table is clustered on (series id, year, month). The original 'Country', 'MajorCity' and 'State' tables are provided as views over this layout, so existing queries continue to work unchanged.
+
+The original (one table per workbook) layout is also defined here so that the two layouts can be compared (see benchmark_temp.py).
+
+See readme for more details.
+'''
+
+import validate_temp
+
+# Dimension tables (names and coordinates are stored once per country/state/city).
+dimensionTables = ["""
+Create Table DimCountry(
+    CountryId Integer Primary Key,
+    Name Text NOT NULL UNIQUE
+);
+""", """
+Create Table DimState(
+    StateId Integer Primary Key,
+    CountryId Integer NOT NULL REFERENCES DimCountry(CountryId),
+    Name Text NOT NULL,
+    CONSTRAINT dimstate_UQ UNIQUE (CountryId, Name)
+);
+""", """
+Create Table DimCity(
+    CityId Integer Primary Key,
+    CountryId Integer NOT NULL REFERENCES DimCountry(CountryId),
+    Name Text NOT NULL,
+    Latitude Real,
+    Longitude Real,
+    CONSTRAINT dimcity_UQ UNIQUE (CountryId, Name)
+);
+"""]
+
+# Fact tables (one row per series per month, clustered on the primary key).
+factTable = """
+Create Table {table}(
+    {seriesId} Integer NOT NULL,
+    Year Integer NOT NULL,
+    Month Integer NOT NULL,
+    AverageTemperature Real,
+    AverageTemperatureUncertainty Real,
+    CONSTRAINT {constraint} Primary Key ({seriesId}, Year, Month)
+) WITHOUT ROWID;
+"""
+
+# Fact table and series id attribute for each of the original tables.
+FACT_TABLES = {'Country': ('FactCountry', 'CountryId'), 'MajorCity': ('FactCity', 'CityId'), 'State': ('FactState', 'StateId')}
+
+KEY_COLUMNS = ['Year', 'Month'] # Columns of the compatibility views that are not spreadsheet headings.
+
+# Compatibility views. Attribute names are taken from the spreadsheet headings (as they were for the original tables).
+# The year and month of each record are also included (after the spreadsheet headings). The date is calculated for every row, so queries should filter on Year and Month to let sqlite use the clustered key of the fact tables.
+compatibilityViews = {
+'Country': """
+Create View Country As
+SELECT printf('%04d-%02d-01', f.Year, f.Month) As {attr1}, f.AverageTemperature As {attr2}, f.AverageTemperatureUncertainty As {attr3}, c.Name As {attr4}, f.Year As Year, f.Month As Month
+FROM FactCountry f JOIN DimCountry c ON c.CountryId = f.CountryId;
+""",
+'MajorCity': """
+Create View MajorCity As
+SELECT printf('%04d-%02d-01', f.Year, f.Month) As {attr1}, f.AverageTemperature As {attr2}, f.AverageTemperatureUncertainty As {attr3}, m.Name As {attr4}, c.Name As {attr5},
+    CASE WHEN m.Latitude IS NULL THEN NULL ELSE printf('%.2f', abs(m.Latitude)) || CASE WHEN m.Latitude < 0 THEN 'S' ELSE 'N' END END As {attr6},
+    CASE WHEN m.Longitude IS NULL THEN NULL ELSE printf('%.2f', abs(m.Longitude)) || CASE WHEN m.Longitude < 0 THEN 'W' ELSE 'E' END END As {attr7}, f.Year As Year, f.Month As Month
+FROM FactCity f JOIN DimCity m ON m.CityId = f.CityId JOIN DimCountry c ON c.CountryId = m.CountryId;
+""",
+'State': """
+Create View State As
+SELECT printf('%04d-%02d-01', f.Year, f.Month) As {attr1}, f.AverageTemperature As {attr2}, f.AverageTemperatureUncertainty As {attr3}, s.Name As {attr4}, c.Name As {attr5}, f.Year As Year, f.Month As Month
+FROM FactState f JOIN DimState s ON s.StateId = f.StateId JOIN DimCountry c ON c.CountryId = s.CountryId;
+"""}
+
+# Original layout (one table per workbook, with names and coordinates repeated on every row).
+legacyTables = {
+'Country': """
+Create Table Country(
+    {attr1} Date,
+    {attr2} Decimal,
+    {attr3} Decimal,
+    {attr4} Varchar2(30),
+    CONSTRAINT country_PK Primary Key ({attr1},{attr4})
+);
+""",
+'MajorCity': """
+Create Table MajorCity(
+    {attr1} Date,
+    {attr2} Decimal,
+    {attr3} Decimal,
+    {attr4} Varchar2(30),
+    {attr5} Varchar2(30),
+    {attr6} Varchar2(9),
+    {attr7} Varchar2(9),
+    CONSTRAINT majorcity_PK Primary Key ({attr1},{attr4},{attr5})
+);
+""",
+'State': """
+Create Table State(
+    {attr1} Date,
+    {attr2} Decimal,
+    {attr3} Decimal,
+    {attr4} Varchar2(30),
+    {attr5} Varchar2(30),
+    CONSTRAINT state_PK Primary Key ({attr1},{attr4},{attr5})
+);
+"""}
+
+legacyIndexes = [
+    "CREATE INDEX i_state_country ON State(Country);",
+    "CREATE INDEX i_state_state ON State(State);",
+    "CREATE INDEX i_state_date ON State(date);",
+    "CREATE INDEX i_majorcity_country ON MajorCity(Country);",
+    "CREATE INDEX i_majorcity_latitude ON MajorCity(Latitude);",
+    "CREATE INDEX i_majorcity_date ON MajorCity(date);",
+    "CREATE INDEX i_country_country ON Country(country);",
+]
+
+
+def attributes(titles):
+    '''Return a dictionary of spreadsheet headings ({attr1}, {attr2}, ...) for formatting the schema definitions.'''
+    return {'attr{}'.format(position + 1): title for position, title in enumerate(titles)}
+
+
+def tableTitles(connection):
+    '''Return the attribute names (spreadsheet headings) of the 'Country', 'MajorCity' and 'State' tables (or views) of an existing database.'''
+    return {tableName: [column[1] for column in connection.execute('PRAGMA table_info("{}");'.format(tableName)).fetchall() if column[1] not in KEY_COLUMNS] for tableName in ['Country', 'MajorCity', 'State']}
+
+
+def createCompactSchema(cursor, titles):
+    '''Create the dimension tables, fact tables and compatibility views. titles is a dictionary of spreadsheet headings for each original table.'''
+    for definition in dimensionTables:
+        cursor.execute(definition)
+    for tableName in ['Country', 'MajorCity', 'State']:
+        factName, seriesId = FACT_TABLES[tableName]
+        cursor.execute(factTable.format(table=factName, seriesId=seriesId, constraint=factName.lower() + '_PK'))
+        cursor.execute(compatibilityViews[tableName].format(**attributes(titles[tableName])))
+
+
+def createLegacySchema(cursor, titles):
+    '''Create the original layout (three tables with repeated names and their indexes).'''
+    for tableName in ['Country', 'MajorCity', 'State']:
+        cursor.execute(legacyTables[tableName].format(**attributes(titles[tableName])))
+    for definition in legacyIndexes:
+        cursor.execute(definition)
+
+
+def newDimensionCache():
+    '''Return an empty cache of dimension ids (name(s) -> id) for each dimension table.'''
+    return {'DimCountry': {}, 'DimState': {}, 'DimCity': {}}
+
+
+def dimensionId(cursor, cache, table, key, extra=()):
+    '''Return the id of a dimension record, adding the record if it does not exist. key is the unique attributes of the record (country id and name, or name only for countries).'''
+    if key in cache[table]:
+        return cache[table][key]
+    if table == 'DimCountry':
+        cursor.execute("Insert Or Ignore Into DimCountry (Name) Values (?);", key)
+        recordId = cursor.execute("Select CountryId From DimCountry Where Name = ?;", key).fetchone()[0]
+    elif table == 'DimState':
+        cursor.execute("Insert Or Ignore Into DimState (CountryId, Name) Values (?,?);", key)
+        recordId = cursor.execute("Select StateId From DimState Where CountryId = ? And Name = ?;", key).fetchone()[0]
+    else:
+        cursor.execute("Insert Or Ignore Into DimCity (CountryId, Name, Latitude, Longitude) Values (?,?,?,?);", key + extra) # Coordinates are taken from the first record of each city.
+        recordId = cursor.execute("Select CityId From DimCity Where CountryId = ? And Name = ?;", key).fetchone()[0]
+    cache[table][key] = recordId
+    return recordId
+
+
+def insertFacts(cursor, tableName, cleanRows, cache):
+    '''Add validated rows (see validate_temp.validateBatch) for one of the original tables to its fact table.'''
+    factName, seriesId = FACT_TABLES[tableName]
+    facts = []
+    for row in cleanRows:
+        if tableName == 'Country':
+            series = dimensionId(cursor, cache, 'DimCountry', (row[3],))
+        elif tableName == 'State':
+            series = dimensionId(cursor, cache, 'DimState', (dimensionId(cursor, cache, 'DimCountry', (row[4],)), row[3]))
+        else:
+            coordinates = (validate_temp.parseCoordinate(row[5], 'NS', 90.0), validate_temp.parseCoordinate(row[6], 'EW', 180.0))
+            series = dimensionId(cursor, cache, 'DimCity', (dimensionId(cursor, cache, 'DimCountry', (row[4],)), row[3]), coordinates)
+        facts.append((series, int(row[0][0:4]), int(row[0][5:7]), row[1], row[2])) # Dates are validated as 'YYYY-MM-01'.
+    cursor.executemany("Insert Into {} Values (?,?,?,?,?);".format(factName), facts)
@@ -0,0 +1,144 @@
+'''
+World Temperature Sharded Database Module
+Version 1.0.
+
+This module provides an optional sharded layout of the database created by db_create.py. The records are partitioned by country into several database files (shards), each with the same layout as 'Temperature_Data.db' (see schema_temp.py). Every shard holds all of the dimension tables (so ids are the same in every shard), but only the monthly records of its own countries.
+
+Queries are run on every shard at the same time (using a pool of threads or processes) and the partial results are merged. Averages are merged from partial sums and counts (an average of averages would be incorrect), and percentiles are merged from the count of each distinct value in each shard (so they are exact). The same functions can be given the single database file, so both layouts are supported.
+
+See readme for more details.
+'''
+
+import os
+import re
+import glob
+import zlib
+import sqlite3
+import concurrent.futures
+import numpy
+import schema_temp
+import database_temp
+
+SHARD_COUNT = 4 # Default number of shard files.
+SHARD_NAME = "Temperature_Data_Shard{}.db" # File name of each shard (numbered from 0).
+
+
+def shardForCountry(country, shardCount=SHARD_COUNT):
+    '''Return the shard number of a country. A checksum of the name is used so that a country is always placed in the same shard.'''
+    return zlib.crc32(country.encode('utf-8')) % shardCount
+
+
+def shardPaths(directory='.'):
+    '''Return the paths of the existing shard files (in shard number order).'''
+    paths = glob.glob(os.path.join(directory, SHARD_NAME.format('*')))
+    return sorted((path for path in paths if re.search(r'(\d+)\.db$', path)), key=lambda path: int(re.search(r'(\d+)\.db$', path).group(1)))
+
+
+def buildShards(sourcePath, shardCount=SHARD_COUNT, directory='.'):
+    '''Partition the records of a database by country into shardCount new shard files. Existing shard files are replaced (each shard is built in a separate file and then published, see database_temp.publishDatabase). Returns the paths of the shards.'''
+    sourceConnection = sqlite3.connect(sourcePath)
+    titles = schema_temp.tableTitles(sourceConnection)
+    countries = sourceConnection.execute("Select CountryId, Name From DimCountry;").fetchall()
+    sourceConnection.close()
+
+    paths = []
+    for shard in range(shardCount):
+        path = os.path.join(directory, SHARD_NAME.format(shard))
+        buildPath = path + database_temp.BUILD_SUFFIX
+        database_temp.removeDatabaseFiles(buildPath)
+        connection = sqlite3.connect(buildPath)
+        connection.execute("PRAGMA journal_mode = OFF;")
+        cursor = connection.cursor()
+        schema_temp.createCompactSchema(cursor, titles)
+        cursor.execute("ATTACH DATABASE ? AS source;", (sourcePath,))
+        cursor.execute("Create Temp Table ShardCountry(CountryId Integer Primary Key);")
+        cursor.executemany("Insert Into ShardCountry Values (?);", [(countryId,) for countryId, name in countries if shardForCountry(name, shardCount) == shard])
+        for dimension in ['DimCountry', 'DimState', 'DimCity']:
+            cursor.execute("Insert Into main.{0} Select * From source.{0};".format(dimension)) # Every shard has all of the dimension records.
+        cursor.execute("Insert Into main.FactCountry Select f.* From source.FactCountry f Where f.CountryId In ShardCountry Order By 1, 2, 3;")
+        cursor.execute("Insert Into main.FactState Select f.* From source.FactState f Join source.DimState d On d.StateId = f.StateId Where d.CountryId In ShardCountry Order By 1, 2, 3;")
+        cursor.execute("Insert Into main.FactCity Select f.* From source.FactCity f Join source.DimCity d On d.CityId = f.CityId Where d.CountryId In ShardCountry Order By 1, 2, 3;")
+        connection.commit()
+        cursor.execute("DETACH DATABASE source;")
+        cursor.execute("ANALYZE;")
+        connection.commit()
+        connection.close()
+        database_temp.publishDatabase(buildPath, path)
+        paths.append(path)
+    for path in shardPaths(directory)[shardCount:]:
+        database_temp.removeDatabaseFiles(path) # Remove old shards (there may have been more of them).
+    return paths
+
+
+def runOnShard(path, query, parameters=()):
+    '''Run a query on one database file and return all of its rows. (This is a module level function so that it can be run in a process pool.)'''
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute(query, parameters).fetchall()
+    finally:
+        connection.close()
+
+
+def fanOut(paths, query, parameters=(), workers=None, processes=False):
+    '''Run a query on every database file at the same time and return a list of the rows from each file.'''
+    executorType = concurrent.futures.ProcessPoolExecutor if processes else concurrent.futures.ThreadPoolExecutor
+    with executorType(max_workers=workers or len(paths)) as executor:
+        return list(executor.map(runOnShard, paths, [query] * len(paths), [parameters] * len(paths)))
+
+
+def groupAverages(paths, value, source, group, condition='1', parameters=(), workers=None, processes=False):
+    '''
+    Return {group: (average, minimum, maximum, count)} of a value (an sql expression) from a table or view, grouped by an sql expression.
+    Each file returns the sum, count, minimum and maximum of each group, which are merged to give the overall results.
+    '''
+    query = '''
+    SELECT {group} As GroupKey, SUM({value}), COUNT({value}), MIN({value}), MAX({value})
+    FROM {source}
+    WHERE {condition}
+    GROUP BY GroupKey;
+    '''.format(group=group, value=value, source=source, condition=condition)
+    merged = {}
+    for rows in fanOut(paths, query, parameters, workers, processes):
+        for key, total, count, minimum, maximum in rows:
+            entry = merged.setdefault(key, [0.0, 0, None, None]) # Sum, count, minimum and maximum of the group so far.
+            if count == 0:
+                continue # The group only has null values in this file.
+            entry[0] += total
+            entry[1] += count
+            entry[2] = minimum if entry[2] is None else min(entry[2], minimum)
+            entry[3] = maximum if entry[3] is None else max(entry[3], maximum)
+    return {key: (total / count if count else None, minimum, maximum, count) for key, (total, count, minimum, maximum) in merged.items()}
+
+
+def percentileFromCounts(values, counts, percentile):
+    '''Return a percentile (0-100) of sorted distinct values with a count of each (using linear interpolation between values, as numpy.percentile does).'''
+    cumulative = numpy.cumsum(counts)
+    rank = percentile / 100.0 * (cumulative[-1] - 1) # Position in the full (sorted) list of values.
+    lower = int(numpy.floor(rank))
+    lowerValue = values[numpy.searchsorted(cumulative, lower, side='right')]
+    upperValue = values[numpy.searchsorted(cumulative, min(lower + 1, cumulative[-1] - 1), side='right')]
+    return lowerValue + (upperValue - lowerValue) * (rank - lower)
+
+
+def groupPercentiles(paths, value, source, group, percentiles, condition='1', parameters=(), workers=None, processes=False):
+    '''
+    Return {group: [one value per percentile]} of a value (an sql expression) from a table or view, grouped by an sql expression.
+    Each file returns the number of times each distinct value occurs in each group, which are merged so the percentiles are exact.
+    '''
+    query = '''
+    SELECT {group} As GroupKey, {value} As Value, COUNT(*)
+    FROM {source}
+    WHERE ({condition}) AND {value} IS NOT NULL
+    GROUP BY GroupKey, Value;
+    '''.format(group=group, value=value, source=source, condition=condition)
+    merged = {}
+    for rows in fanOut(paths, query, parameters, workers, processes):
+        for key, groupValue, count in rows:
+            counts = merged.setdefault(key, {})
+            counts[groupValue] = counts.get(groupValue, 0) + count
+    results = {}
+    for key, counts in merged.items():
+        values = numpy.array(sorted(counts), dtype=float)
+        valueCounts = numpy.array([counts[groupValue] for groupValue in sorted(counts)])
+        results[key] = [float(percentileFromCounts(values, valueCounts, percentile)) for percentile in percentiles]
+    return results
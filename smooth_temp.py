@@ -0,0 +1,99 @@
+'''
+World Temperature Smoothing Module
+Version 1.0.
+
+This module calculates moving averages and coarser resolution averages (eg. monthly to yearly, or yearly to decadal) of temperature series. Series are stored in an ndarray (one row per series and one column per time step, with nan for missing data).
+
+Both calculations use cumulative sums (and cumulative counts) of the data that is present. The sum of any window is then the difference between two cumulative sums, so each output value costs the same regardless of the window size. Missing values do not count toward an average, and an average is only given where the window contains at least a minimum fraction (the coverage) of values, otherwise it is nan.
+
+See readme for more details.
+'''
+
+import numpy
+
+MINIMUM_COVERAGE = 0.5 # Default fraction of a window that must contain data for an average to be given.
+
+
+def prefixSums(values, axis=-1):
+    '''
+    Return (cumulative sums, cumulative counts) of the values that are not nan along an axis.
+    Both arrays have one more element along the axis than values (starting at 0), so the sum of values[start:end] is sums[end] - sums[start].
+    '''
+    values = numpy.asarray(values, dtype=float)
+    present = ~numpy.isnan(values)
+    shape = list(values.shape)
+    shape[axis] = 1
+    zeros = numpy.zeros(shape)
+    sums = numpy.concatenate([zeros, numpy.cumsum(numpy.where(present, values, 0.0), axis=axis)], axis=axis)
+    counts = numpy.concatenate([zeros, numpy.cumsum(present, axis=axis, dtype=float)], axis=axis)
+    return sums, counts
+
+
+def fillSteps(steps, values, axis=-1):
+    '''
+    Return (consecutive steps, values with nan added for missing steps, position of each original step) for integer time steps (eg. years) that may have gaps.
+    Windows are measured in positions, so series must be filled before they are averaged.
+    '''
+    steps = numpy.asarray(steps, dtype=int)
+    allSteps = numpy.arange(steps.min(), steps.max() + 1) if len(steps) else steps
+    positions = steps - (allSteps[0] if len(steps) else 0)
+    values = numpy.asarray(values, dtype=float)
+    shape = list(values.shape)
+    shape[axis] = len(allSteps)
+    filled = numpy.full(shape, numpy.nan)
+    index = [slice(None)] * values.ndim
+    index[axis] = positions
+    filled[tuple(index)] = values
+    return allSteps, filled, positions
+
+
+def windowAverages(prefix, starts, ends, window, minCoverage, axis=-1):
+    '''Return the average of each window [starts, ends) from prefix sums, or nan where less than minCoverage of window values are present.'''
+    sums, counts = prefix
+    windowSums = numpy.take(sums, ends, axis=axis) - numpy.take(sums, starts, axis=axis)
+    windowCounts = numpy.take(counts, ends, axis=axis) - numpy.take(counts, starts, axis=axis)
+    enough = (windowCounts >= minCoverage * window) & (windowCounts > 0)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        return numpy.where(enough, windowSums / windowCounts, numpy.nan)
+
+
+def movingAverage(values, window, centered=False, minCoverage=MINIMUM_COVERAGE, axis=-1, prefix=None):
+    '''
+    Return the moving average of each series (along an axis) over a window of time steps.
+    A trailing window ends at each time step. A centered window is placed around each time step (with the extra step after it when the window is even).
+    Windows are cut short at the start and end of a series (the coverage is still measured against the full window).
+    prefix can be given (from prefixSums) to avoid recalculating it for several windows.
+    '''
+    if prefix is None:
+        prefix = prefixSums(values, axis)
+    length = prefix[0].shape[axis] - 1
+    positions = numpy.arange(length)
+    if centered:
+        starts = positions - (window - 1) // 2
+    else:
+        starts = positions - window + 1
+    ends = numpy.clip(starts + window, 0, length)
+    starts = numpy.clip(starts, 0, length)
+    return windowAverages(prefix, starts, ends, window, minCoverage, axis)
+
+
+def rollup(values, factor, offset=0, minCoverage=MINIMUM_COVERAGE, axis=-1, prefix=None):
+    '''
+    Return the average of each block of factor time steps (eg. 12 months to a year, or 10 years to a decade).
+    Blocks start at offset + k * factor. offset can be negative so that the first block is partial (eg. -(firstYear % 10) aligns blocks with decades).
+    Returns (index of the first time step of each block, averages with one element per block along the axis).
+    '''
+    if prefix is None:
+        prefix = prefixSums(values, axis)
+    length = prefix[0].shape[axis] - 1
+    blockStarts = numpy.arange(offset, length, factor)
+    ends = numpy.clip(blockStarts + factor, 0, length)
+    starts = numpy.clip(blockStarts, 0, length)
+    return blockStarts, windowAverages(prefix, starts, ends, factor, minCoverage, axis)
+
+
+def decadeAverages(years, values, minCoverage=MINIMUM_COVERAGE, axis=-1):
+    '''Return (first year of each decade, decadal averages) of yearly series. years must be consecutive (see fillSteps).'''
+    offset = -(years[0] % 10)
+    blockStarts, averages = rollup(values, 10, offset, minCoverage, axis)
+    return [int(years[0] + start) for start in blockStarts], averages
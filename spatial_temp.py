@@ -0,0 +1,232 @@
+'''
+World Temperature Spatial Index Module
+Version 1.0.
+
+This module builds an in-memory spatial index (a KD-tree) of the major cities in the database, using the latitude and longitude of each city from the 'DimCity' table. Cities are placed on a unit sphere (as x, y, z coordinates) so that straight line distances in the tree give the same ordering as distances over the surface of the earth.
+
+The index answers k-nearest city and radius (within a distance) queries, and estimates the temperature at any coordinate by inverse distance weighted (IDW) interpolation of the nearest cities. Estimates are calculated for a batch of coordinates and months at once.
+
+This script can also be run directly to estimate the monthly temperature at a coordinate entered by the user.
+
+See readme for more details.
+'''
+
+import heapq
+import numpy
+import validate_temp
+import stream_temp
+
+EARTH_RADIUS = 6371.0 # Mean radius of the earth (kilometres).
+LEAF_SIZE = 8 # Maximum number of cities in a leaf of the tree.
+NEIGHBOURS = 5 # Default number of cities used for interpolation.
+POWER = 2 # Default power of the inverse distance weights.
+
+
+def toUnitVectors(latitudes, longitudes):
+    '''Convert latitudes and longitudes (signed degrees) to points on a unit sphere (an array with one row of x, y, z per point).'''
+    latitudes = numpy.radians(numpy.asarray(latitudes, dtype=float))
+    longitudes = numpy.radians(numpy.asarray(longitudes, dtype=float))
+    return numpy.column_stack([numpy.cos(latitudes) * numpy.cos(longitudes), numpy.cos(latitudes) * numpy.sin(longitudes), numpy.sin(latitudes)])
+
+
+def chordToKilometres(chords):
+    '''Convert straight line distances between points on the unit sphere to distances over the surface of the earth.'''
+    return 2.0 * EARTH_RADIUS * numpy.arcsin(numpy.clip(numpy.asarray(chords, dtype=float) / 2.0, 0.0, 1.0))
+
+
+def kilometresToChord(kilometres):
+    '''Convert a distance over the surface of the earth to a straight line distance between points on the unit sphere.'''
+    return 2.0 * numpy.sin(min(kilometres / EARTH_RADIUS, numpy.pi) / 2.0)
+
+
+class CityIndex:
+    '''KD-tree of city coordinates. Each node is (start, end, left child, right child, lower bounds, upper bounds), where start:end are positions in self.order.'''
+
+    def __init__(self, names, latitudes, longitudes, leafSize=LEAF_SIZE):
+        self.names = list(names)
+        self.latitudes = numpy.asarray(latitudes, dtype=float)
+        self.longitudes = numpy.asarray(longitudes, dtype=float)
+        self.points = toUnitVectors(self.latitudes, self.longitudes)
+        self.order = numpy.arange(len(self.names)) # City numbers, arranged so that every node covers a contiguous range.
+        self.leafSize = leafSize
+        self.nodes = []
+        if len(self.names) > 0:
+            self.buildNode(0, len(self.names))
+
+    def buildNode(self, start, end):
+        '''Add a node covering self.order[start:end] (and its children) to the tree and return its node number.'''
+        cityPoints = self.points[self.order[start:end]]
+        lower = cityPoints.min(axis=0)
+        upper = cityPoints.max(axis=0)
+        nodeNumber = len(self.nodes)
+        self.nodes.append(None) # Reserve the node number before the children are added.
+        if end - start <= self.leafSize:
+            self.nodes[nodeNumber] = (start, end, -1, -1, lower, upper)
+            return nodeNumber
+        axis = numpy.argmax(upper - lower) # Split along the widest dimension.
+        self.order[start:end] = self.order[start:end][numpy.argsort(cityPoints[:, axis], kind='stable')]
+        middle = (start + end) // 2
+        left = self.buildNode(start, middle)
+        right = self.buildNode(middle, end)
+        self.nodes[nodeNumber] = (start, end, left, right, lower, upper)
+        return nodeNumber
+
+    def boxDistance(self, point, nodeNumber):
+        '''Return the squared straight line distance from a point to the bounding box of a node (0 if the point is inside).'''
+        lower, upper = self.nodes[nodeNumber][4], self.nodes[nodeNumber][5]
+        gap = numpy.maximum(numpy.maximum(lower - point, point - upper), 0.0)
+        return float(gap @ gap)
+
+    def nearestToPoint(self, point, k):
+        '''Return a list of (squared straight line distance, city number) of the k cities nearest to a point on the unit sphere (nearest first).'''
+        best = [] # Heap of (-squared distance, city number), so the furthest of the current best cities is first.
+        stack = [(0.0, 0)] if self.nodes else []
+        while stack:
+            distance, nodeNumber = stack.pop()
+            if len(best) == k and distance >= -best[0][0]:
+                continue # No city in this node can be nearer than the current best cities.
+            start, end, left, right = self.nodes[nodeNumber][:4]
+            if left < 0:
+                cities = self.order[start:end]
+                differences = self.points[cities] - point
+                for city, cityDistance in zip(cities, numpy.einsum('ij,ij->i', differences, differences)):
+                    if len(best) < k:
+                        heapq.heappush(best, (-cityDistance, int(city)))
+                    elif cityDistance < -best[0][0]:
+                        heapq.heapreplace(best, (-cityDistance, int(city)))
+                continue
+            children = sorted([(self.boxDistance(point, left), left), (self.boxDistance(point, right), right)], reverse=True)
+            stack.extend(children) # The nearer child is searched first (it is added to the stack last).
+        return sorted((-distance, city) for distance, city in best)
+
+    def nearest(self, latitudes, longitudes, k=NEIGHBOURS):
+        '''
+        Return the k nearest cities to each coordinate (signed degrees).
+        Returns (array of city numbers, array of distances in kilometres), each with one row per coordinate (nearest city first).
+        '''
+        k = min(k, len(self.names))
+        targets = toUnitVectors(numpy.atleast_1d(latitudes), numpy.atleast_1d(longitudes))
+        cities = numpy.zeros((len(targets), k), dtype=int)
+        chords = numpy.zeros((len(targets), k))
+        for position, point in enumerate(targets):
+            found = self.nearestToPoint(point, k)
+            cities[position] = [city for distance, city in found]
+            chords[position] = numpy.sqrt([distance for distance, city in found])
+        return cities, chordToKilometres(chords)
+
+    def within(self, latitude, longitude, kilometres):
+        '''Return a list of (distance in kilometres, city number) of all cities within a distance of a coordinate (nearest first).'''
+        point = toUnitVectors([latitude], [longitude])[0]
+        limit = kilometresToChord(kilometres) ** 2
+        found = []
+        stack = [0] if self.nodes else []
+        while stack:
+            nodeNumber = stack.pop()
+            if self.boxDistance(point, nodeNumber) > limit:
+                continue # The node is entirely outside the radius.
+            start, end, left, right = self.nodes[nodeNumber][:4]
+            if left < 0:
+                cities = self.order[start:end]
+                differences = self.points[cities] - point
+                distances = numpy.einsum('ij,ij->i', differences, differences)
+                found.extend((float(distance), int(city)) for city, distance in zip(cities, distances) if distance <= limit)
+            else:
+                stack.extend([left, right])
+        return [(float(chordToKilometres(numpy.sqrt(distance))), city) for distance, city in sorted(found)]
+
+    def interpolate(self, latitudes, longitudes, values, k=NEIGHBOURS, power=POWER):
+        '''
+        Estimate values at each coordinate by inverse distance weighting of the k nearest cities.
+        values is an array with one row per city (in the order of self.names) and one column per month (nan for missing data).
+        Returns an array with one row per coordinate and one column per month. Missing city values are skipped (the weights of the remaining cities are used), and a coordinate at a city takes that city's value in the months it has data.
+        '''
+        cities, distances = self.nearest(latitudes, longitudes, k)
+        return inverseDistanceWeighting(cities, distances, values, power)
+
+
+def inverseDistanceWeighting(cities, distances, values, power=POWER):
+    '''
+    Combine the values of neighbouring cities (arrays of city numbers and distances, one row per target) into one estimate per target and month.
+    A target at a city takes that city's value in every month the city has data, and the weights of the other cities in months where it does not.
+    '''
+    values = numpy.asarray(values, dtype=float)
+    exact = (distances < 1e-9)[:, :, numpy.newaxis] # Neighbours that are at the target.
+    neighbourValues = values[cities] # One row per target, one column per neighbour, one layer per month.
+    present = ~numpy.isnan(neighbourValues)
+    with numpy.errstate(divide='ignore'):
+        weights = numpy.where(exact, 0.0, 1.0 / distances[:, :, numpy.newaxis] ** power) * present
+    exactPresent = exact & present
+    weights = numpy.where(exactPresent.any(axis=1, keepdims=True), exactPresent.astype(float), weights) # The city at the target is used in the months it has data.
+    totals = (weights * numpy.where(present, neighbourValues, 0.0)).sum(axis=1)
+    weightTotals = weights.sum(axis=1)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        return numpy.where(weightTotals > 0, totals / weightTotals, numpy.nan)
+
+
+def loadCityIndex(connection, leafSize=LEAF_SIZE):
+    '''Build a CityIndex of every city in the 'DimCity' table that has a latitude and longitude. City names are given as (city, country).'''
+    rows = connection.execute('''
+    SELECT m.Name, c.Name, m.Latitude, m.Longitude
+    FROM DimCity m JOIN DimCountry c ON c.CountryId = m.CountryId
+    WHERE m.Latitude IS NOT NULL AND m.Longitude IS NOT NULL;
+    ''').fetchall() # Coordinates are read as signed degrees, cities without one cannot be placed in the index.
+    names = [(city, country) for city, country, latitude, longitude in rows]
+    return CityIndex(names, [row[2] for row in rows], [row[3] for row in rows], leafSize)
+
+
+def loadCityTemperatures(connection, index, startDate, endDate):
+    '''Return (list of months, array with one row per city in the index and one column per month) of average temperatures between two dates ('YYYY-MM-DD').'''
+    cursor = connection.execute('''
+    SELECT date, City, Country, AverageTemperature
+    FROM MajorCity
+    WHERE Year BETWEEN ? AND ? AND date BETWEEN ? AND ?
+    ORDER BY date;
+    ''', (int(startDate[0:4]), int(endDate[0:4]), startDate, endDate)) # The range of years lets the database read only the records between the dates.
+    records = ((row[0], (row[1], row[2]), row[3]) for row in stream_temp.readRows(cursor)) # Records of (month, city, temperature).
+    months, temperatures = stream_temp.buildArray(stream_temp.pivotRows(records, index.names), len(index.names))
+    return months, temperatures.T
+
+
+if __name__ == '__main__':
+    print("Initializing.\n")
+    import database_temp
+    from os.path import isfile
+    if not isfile("Temperature_Data.db"): # Check that database file exists...
+        print("Error, 'Temperature_Data.db' does not exist. Please run 'db_create.py' first.") # Prompt to run the creation script if it does not.
+        exit(0)
+    dbConnection = database_temp.openDatabase("Temperature_Data.db", database_temp.hotModeRequested())
+    dbGeneration = database_temp.databaseGeneration(dbConnection)
+    print("Building spatial index of major cities...")
+    cityIndex = loadCityIndex(dbConnection)
+    print("Success. {} cities indexed.\n".format(len(cityIndex.names)))
+
+    while True:
+        entry = input("Enter a coordinate (eg. 27.47S 153.03E): ").upper().split() # Get and capitalize user input.
+        if len(entry) == 2:
+            latitude = validate_temp.parseCoordinate(entry[0], 'NS', 90.0)
+            longitude = validate_temp.parseCoordinate(entry[1], 'EW', 180.0)
+            if latitude is not None and longitude is not None:
+                break
+        print("Error! Please enter a latitude and longitude in the form '27.47S 153.03E'") # Reprompt otherwise.
+    while True:
+        year = input("Enter a year (eg. 2000): ")
+        if year.isdigit() and len(year) == 4:
+            break
+        print("Error! Please enter a four digit year.")
+
+    dbConnection, loadedGeneration = database_temp.reopenIfRebuilt(dbConnection, "Temperature_Data.db", dbGeneration) # The database may have been replaced while waiting for the user.
+    if loadedGeneration != dbGeneration: # City ids and coordinates may have changed, so the index is rebuilt.
+        cityIndex = loadCityIndex(dbConnection)
+        print("Success. {} cities indexed.".format(len(cityIndex.names)))
+
+    print("\nNearest major cities...")
+    cities, distances = cityIndex.nearest(latitude, longitude, NEIGHBOURS)
+    for city, distance in zip(cities[0], distances[0]):
+        print("     {}, {} ({:.0f} km)".format(cityIndex.names[city][0], cityIndex.names[city][1], distance))
+
+    months, temperatures = loadCityTemperatures(dbConnection, cityIndex, '{}-01-01'.format(year), '{}-12-31'.format(year))
+    database_temp.closeDatabase(dbConnection)
+    estimates = cityIndex.interpolate(latitude, longitude, temperatures)
+    print("\nEstimated average temperatures for {}...".format(year))
+    for month, estimate in zip(months, estimates[0]):
+        print("     {}: {}".format(month, '-' if numpy.isnan(estimate) else '{0:.3f}'.format(estimate)))
@@ -16,6 +16,7 @@ print("Initializing.\n")
 import sqlite3
 from os.path import isfile
 import datetime
+import database_temp
 
 def yesNoInput(prompt=""):
     while True:
@@ -33,13 +34,13 @@ if not isfile("Temperature_Data.db"): # Check that database file exists...
     print("Error, 'Temperature_Data.db' does not exist. Please run 'db_create.py' first.") # Prompt to run the creation script if it does not.
     exit(0)
 
-dbConnection = sqlite3.connect("Temperature_Data.db") # Open connection to the (existing) database.
+dbConnection = database_temp.openDatabase("Temperature_Data.db", database_temp.hotModeRequested()) # Open connection to the (existing) database (or to an in-memory copy of it in hot mode).
 print("\nOpening 'Temperature_Data.db'")
 print("Connected to database.", datetime.datetime.now(),"\nSqlite version:", sqlite3.sqlite_version, "\n")
 dbCursor = dbConnection.cursor() # Create cursor object.
 
 print("Checking Tables...\n")
-existingTables = dbCursor.execute("Select Name From sqlite_master Where type = 'table';").fetchall() # Obtaining table names that exist in the database.
+existingTables = dbCursor.execute("Select Name From sqlite_master Where type In ('table', 'view');").fetchall() # Obtaining table (and view) names that exist in the database.
 existingTables = [name[0] for name in existingTables] # Extracting table names from the database output.
 missingTables = [name for name in ['Country', 'MajorCity', 'State'] if name not in existingTables] # Compile list of 'expected' tables in the database that are NOT present.
 
@@ -48,7 +49,7 @@ if len(missingTables) >0: # This branch is executed if the database is mising on
         print("'{}' Table is missing.".format(name)) # Alert user that table(s) are missing.
     print("\nError, 'Temperature_Data.db has incomplete data. Please run 'db_create.py' to ensure all appropriate data is available for the program.\n") # Prompt user to run the creation script.
     print("Disconnecting from the database...")
-    dbConnection.close() # Close the database connection.
+    database_temp.closeDatabase(dbConnection) # Close the database connection.
     print("Disconnected from the database.", datetime.datetime.now())
     exit(0) # Terminate the program.
 else: # Everything is fine and the program continues.
@@ -81,7 +82,7 @@ Create Table "Southern Cities"(
 if 'Southern Cities' in existingTables: # Check that the new table does not exist.
     if not yesNoInput("'Southern Cities' Table already exists. Continuing will override the table and all of its data. Would you like to continue (Y/N)?"): # Give user the option to quit.
         print("\nDisconnecting from the database...")
-        dbConnection.close()
+        database_temp.closeDatabase(dbConnection)
         print("Disconnected from the database.", datetime.datetime.now())
         exit(0)
     else:
@@ -105,8 +106,8 @@ SELECT min(AverageTemperature), max(AverageTemperature), avg(AverageTemperature)
 FROM State 
 WHERE state='Queensland' AND
     country='Australia' AND
-	Date BETWEEN '2000-01-01' AND '2000-12-31';
-''' # Query for statistics from the database.
+	Year = 2000;
+''' # Query for statistics from the database. (Filtering on Year rather than Date lets the database read only the records for 2000.)
 
 print("\nRetrieving statistical data for average temperatures in 'Queensland, Australia' in the year 2000...")
 queenslandStats=dbCursor.execute(query).fetchone()
@@ -124,5 +125,5 @@ print("\nCommiting changes to the database...")
 dbConnection.commit()
 print("Success.\n")
 print("Disconnecting from the database...")
-dbConnection.close()
+database_temp.closeDatabase(dbConnection)
 print("Disconnected from the database.",datetime.datetime.now())
@@ -0,0 +1,98 @@
+'''
+World Temperature Report Streaming Module
+Version 1.0.
+
+This module is used by excel_temp.py and numpy_temp.py to move query results from the database to a report without holding the whole result set in memory. A report is built as a pipeline of three stages...
+
+    readRows - Fetches rows from a database cursor in chunks.
+    pivotRows - Turns (row key, column key, value) records into one row per row key (with a value for every column).
+    writeWorksheet / buildArray / writeCsv - Adds each row to a worksheet, a numpy array or a csv file.
+
+Each stage is a generator (except the final sink), so only one chunk of query results and one output row are held at a time. Each stage records the number of rows it has processed in a counts dictionary, which can be displayed with reportCounts.
+
+See readme for more details.
+'''
+
+import csv
+import numpy
+
+CHUNK_SIZE = 1000 # Number of rows fetched from the database at a time.
+
+
+def countRows(counts, stage, number=1):
+    '''Add to the number of rows processed by a stage (counts may be None).'''
+    if counts is not None:
+        counts[stage] = counts.get(stage, 0) + number
+
+
+def readRows(cursor, chunkSize=CHUNK_SIZE, counts=None):
+    '''Yield the rows of an executed query, fetching chunkSize rows from the database at a time.'''
+    while True:
+        rows = cursor.fetchmany(chunkSize)
+        if not rows:
+            break
+        countRows(counts, 'Read', len(rows))
+        for row in rows:
+            yield row
+
+
+def pivotRows(rows, columns, counts=None):
+    '''
+    Yield [row key] + [one value per column] for records of (row key, column key, value).
+    The records must be ordered by row key. Columns without a record for a row key are given a value of None.
+    '''
+    positions = {column: position for position, column in enumerate(columns)} # Position of each column in an output row.
+    currentKey = None
+    values = None
+    for rowKey, columnKey, value in rows:
+        if values is not None and rowKey != currentKey: # All records for the previous row key have been received.
+            countRows(counts, 'Pivot')
+            yield [currentKey] + values
+            values = None
+        if values is None:
+            currentKey = rowKey
+            values = [None] * len(columns) # Placeholder values (for columns that do not have a record).
+        if columnKey in positions:
+            values[positions[columnKey]] = value
+    if values is not None:
+        countRows(counts, 'Pivot')
+        yield [currentKey] + values
+
+
+def writeWorksheet(worksheet, rows, counts=None):
+    '''Append each row to an openpyxl worksheet.'''
+    for row in rows:
+        worksheet.append(row)
+        countRows(counts, 'Worksheet')
+
+
+def buildArray(rows, width, counts=None, chunkSize=CHUNK_SIZE):
+    '''
+    Build a float array (nan for missing values) from rows of [row key] + [width values].
+    Returns (list of row keys, array with one row per row key). The array grows in chunks, so no intermediate list of rows is kept.
+    '''
+    keys = []
+    array = numpy.empty((chunkSize, width), dtype=float)
+    for row in rows:
+        if len(keys) == array.shape[0]:
+            array = numpy.concatenate([array, numpy.empty((max(chunkSize, array.shape[0]), width), dtype=float)]) # Double the array (at least one more chunk).
+        array[len(keys)] = [numpy.nan if value is None else value for value in row[1:]]
+        keys.append(row[0])
+        countRows(counts, 'Array')
+    return keys, array[:len(keys)]
+
+
+def writeCsv(path, header, rows, counts=None):
+    '''Write a header row and each row to a csv file.'''
+    with open(path, 'w', newline='') as csvFile:
+        writer = csv.writer(csvFile)
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(['' if value is None else value for value in row])
+            countRows(counts, 'Csv')
+
+
+def reportCounts(counts):
+    '''Display the number of rows processed by each stage.'''
+    for stage in counts:
+        print("     {}: {} rows processed.".format(stage, counts[stage]))
@@ -0,0 +1,152 @@
+'''
+World Temperature Import Validation Module
+Version 1.0.
+
+This module is used by db_create.py to validate spreadsheet rows in batches before they are added to the database. Each batch is checked column-wise (key attributes, dates, numeric types and ranges, coordinate formats and duplicate primary keys). Clean rows are returned ready for a bulk insert and rejected rows are returned with a reason code so that they can be written to the 'Quarantine' table instead of terminating the import.
+
+See readme for more details.
+'''
+
+import re
+import datetime
+import numpy
+
+BATCH_SIZE = 5000 # Number of spreadsheet rows validated and inserted at a time.
+COORDINATE_LENGTH = 9 # Maximum length of the latitude/longitude attributes (Varchar2(9) in the schema).
+TEMPERATURE_RANGE = (-90.0, 60.0) # Plausible range for a monthly average land temperature (degrees Celsius).
+UNCERTAINTY_RANGE = (0.0, 20.0) # Plausible range for the uncertainty of a monthly average (degrees Celsius).
+
+# Reason codes recorded against quarantined rows. A row failing several checks is reported under the first code in this list.
+REASON_CODES = ['MISSING_KEY', 'BAD_DATE', 'BAD_NUMBER', 'OUT_OF_RANGE', 'BAD_COORDINATE', 'DUPLICATE_KEY']
+
+# Spreadsheet layout of each table (column positions from left to right, starting at 0).
+TABLE_LAYOUTS = {
+    'Country': {'columns': 4, 'keys': (0, 3), 'coordinates': ()},
+    'MajorCity': {'columns': 7, 'keys': (0, 3, 4), 'coordinates': ((5, 'NS', 90.0), (6, 'EW', 180.0))},
+    'State': {'columns': 5, 'keys': (0, 3, 4), 'coordinates': ()},
+}
+
+quarantineTable = """
+Create Table Quarantine(
+    SourceTable Varchar2(30) NOT NULL,
+    SourceRow Integer NOT NULL,
+    Reason Varchar2(20) NOT NULL,
+    RawData Text,
+    CONSTRAINT quarantine_PK Primary Key (SourceTable, SourceRow)
+);
+""" # Schema for the 'Quarantine' table (rejected spreadsheet rows and the reason they were rejected).
+
+coordinatePattern = re.compile(r'^(\d{1,3}(?:\.\d+)?)([NSEW])$') # Coordinates are stored as degrees followed by a hemisphere letter (eg. '39.38N').
+
+
+def isBlank(value):
+    '''Return True if a cell value is empty (None or whitespace only).'''
+    return value is None or (isinstance(value, str) and value.strip() == '')
+
+
+def parseDate(value):
+    '''Return a cell value as an ISO date string ('YYYY-MM-01'), or None if it is not a valid date. Records are monthly so the date must be the first day of a month.'''
+    if isinstance(value, str):
+        for dateFormat in ('%Y-%m-%d', '%Y-%m-%d %H:%M:%S'): # Dates before 1900 are read from excel as text.
+            try:
+                value = datetime.datetime.strptime(value.strip(), dateFormat)
+                break
+            except ValueError:
+                continue
+    if not isinstance(value, (datetime.datetime, datetime.date)) or value.day != 1:
+        return None
+    return '{:04d}-{:02d}-01'.format(value.year, value.month)
+
+
+def parseNumbers(column):
+    '''Convert a column of cell values to a float array (nan for missing values) and a mask of values that are not numbers.'''
+    values = numpy.full(len(column), numpy.nan)
+    invalid = numpy.zeros(len(column), dtype=bool)
+    for position, value in enumerate(column):
+        if isBlank(value):
+            continue # Missing values are allowed (they are added as null values).
+        try:
+            values[position] = float(value)
+        except (TypeError, ValueError):
+            invalid[position] = True
+    invalid |= numpy.isinf(values) # Infinite values cannot be represented in the database.
+    return values, invalid
+
+
+def parseCoordinate(value, hemispheres, limit):
+    '''Return a coordinate string (eg. '39.38N') as signed degrees, or None if it is not valid. Southern and western coordinates are negative.'''
+    if not isinstance(value, str) or len(value) > COORDINATE_LENGTH:
+        return None
+    match = coordinatePattern.match(value.strip())
+    if match is None or match.group(2) not in hemispheres:
+        return None
+    degrees = float(match.group(1))
+    if degrees > limit:
+        return None
+    return -degrees if match.group(2) in 'SW' else degrees
+
+
+def readBatches(worksheet, batchSize=BATCH_SIZE):
+    '''Yield (first row number, list of row values) for each batch of data rows in a worksheet (the heading row is skipped).'''
+    batch = []
+    firstRow = 2
+    for line in worksheet.iter_rows(min_row=2, max_row=worksheet.max_row, max_col=worksheet.max_column):
+        batch.append(tuple(cell.value for cell in line))
+        if len(batch) == batchSize:
+            yield firstRow, batch
+            firstRow += len(batch)
+            batch = []
+    if batch:
+        yield firstRow, batch
+
+
+def validateBatch(tableName, firstRow, rows, seenKeys):
+    '''
+    Validate a batch of spreadsheet rows for a table.
+    Returns (clean rows, rejected rows). Clean rows are tuples ready to be inserted into the table. Rejected rows are tuples for the 'Quarantine' table (source table, row number, reason code, raw data).
+    seenKeys is a set of primary keys already accepted for this table, it is updated with the keys of the clean rows.
+    '''
+    layout = TABLE_LAYOUTS[tableName]
+    width = layout['columns']
+    rows = [tuple(row[:width]) + (None,) * (width - len(row)) for row in rows] # Pad short rows so every row has a value for each attribute.
+    columns = list(zip(*rows)) if rows else [()] * width
+
+    # Each check produces a boolean mask over the batch (True where the row fails the check).
+    missingKey = numpy.zeros(len(rows), dtype=bool)
+    for position in layout['keys']:
+        missingKey |= numpy.array([isBlank(value) for value in columns[position]], dtype=bool)
+
+    dates = [parseDate(value) for value in columns[0]]
+    badDate = numpy.array([date is None for date in dates], dtype=bool)
+
+    temperatures, badTemperature = parseNumbers(columns[1])
+    uncertainties, badUncertainty = parseNumbers(columns[2])
+    badNumber = badTemperature | badUncertainty
+    with numpy.errstate(invalid='ignore'): # Missing values (nan) are never out of range.
+        outOfRange = (temperatures < TEMPERATURE_RANGE[0]) | (temperatures > TEMPERATURE_RANGE[1])
+        outOfRange |= (uncertainties < UNCERTAINTY_RANGE[0]) | (uncertainties > UNCERTAINTY_RANGE[1])
+
+    badCoordinate = numpy.zeros(len(rows), dtype=bool)
+    for position, hemispheres, limit in layout['coordinates']:
+        badCoordinate |= numpy.array([not isBlank(value) and parseCoordinate(value, hemispheres, limit) is None for value in columns[position]], dtype=bool)
+
+    reasons = numpy.select([missingKey, badDate, badNumber, outOfRange, badCoordinate], REASON_CODES[:-1], default='') # First failing check for each row.
+
+    cleanRows = []
+    rejectedRows = []
+    for position, row in enumerate(rows):
+        reason = reasons[position]
+        if not reason:
+            names = tuple(str(row[index]).strip() for index in layout['keys'][1:])
+            key = (dates[position],) + names
+            if key in seenKeys: # Duplicate primary key (either earlier in this batch or in a previous batch).
+                reason = 'DUPLICATE_KEY'
+            else:
+                seenKeys.add(key)
+                temperature = None if numpy.isnan(temperatures[position]) else float(temperatures[position])
+                uncertainty = None if numpy.isnan(uncertainties[position]) else float(uncertainties[position])
+                others = tuple(None if isBlank(value) else str(value).strip() for value in row[3 + len(names):])
+                cleanRows.append((dates[position], temperature, uncertainty) + names + others)
+                continue
+        rejectedRows.append((tableName, firstRow + position, str(reason), '|'.join('' if value is None else str(value) for value in row)))
+    return cleanRows, rejectedRows
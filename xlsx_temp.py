@@ -0,0 +1,361 @@
+'''
+World Temperature Workbook Update Module
+Version 1.0.
+
+This module replaces (or adds) a single worksheet of an existing excel workbook without loading or saving the rest of the workbook. An xlsx workbook is a zip file holding one xml file for each worksheet (and for each of its charts), along with a few small files listing the sheets, the relationships between files, their content types and the cell styles. The new worksheet is created with openpyxl in a separate (scratch) workbook holding only that sheet. Its files are then added to the end of the existing zip file, and the sheet list, relationships, content types and styles are updated. Other worksheets are never read or rewritten, so the time taken depends only on the size of the sheet being replaced.
+
+The files of a replaced sheet are left in the zip file, but are removed from its directory so they are no longer part of the workbook. Files that are also used by another part of the workbook (eg. an image shared by two sheets, or a pivot cache) are kept. When this unused space is more than half of the file, the workbook is compacted (rewritten without it).
+
+See readme for more details.
+'''
+
+import io
+import os
+import re
+import copy
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ElementTree
+
+MAIN_NAMESPACE = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+RELATIONSHIP_NAMESPACE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_NAMESPACE = 'http://schemas.openxmlformats.org/package/2006/relationships'
+CONTENT_TYPES_NAMESPACE = 'http://schemas.openxmlformats.org/package/2006/content-types'
+WORKSHEET_TYPE = RELATIONSHIP_NAMESPACE + '/worksheet'
+CALCULATION_CHAIN_TYPE = RELATIONSHIP_NAMESPACE + '/calcChain'
+WORKSHEET_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml'
+FIRST_CUSTOM_FORMAT = 164 # Number formats below this id are built into excel.
+COMPACT_RATIO = 0.5 # The workbook is compacted when more than this fraction of the file is unused.
+ZIPFILE_ATTRIBUTES = ['filelist', 'NameToInfo', 'start_dir'] # Undocumented ZipFile attributes used to remove files from the zip directory (see appendFiles).
+
+
+def main(tag):
+    '''Return the qualified name of a spreadsheet element.'''
+    return '{%s}%s' % (MAIN_NAMESPACE, tag)
+
+
+def readXml(data):
+    '''Parse an xml file. Returns (root element, list of (prefix, namespace) declared in the file).'''
+    namespaces = [namespace for event, namespace in ElementTree.iterparse(io.BytesIO(data), events=['start-ns'])]
+    return ElementTree.fromstring(data), namespaces
+
+
+def writeXml(root, namespaces):
+    '''Serialize an xml file using the namespace prefixes of the original file.'''
+    for prefix, uri in namespaces:
+        ElementTree.register_namespace(prefix, uri)
+    data = ElementTree.tostring(root, encoding='UTF-8', xml_declaration=True)
+    end = data.index(b'>', data.index(b'<', data.index(b'?>') + 2)) # End of the root start tag.
+    missing = b''.join(' xmlns:{}="{}"'.format(prefix, uri).encode('utf-8') for prefix, uri in namespaces if prefix and ' xmlns:{}='.format(prefix).encode('utf-8') not in data[:end])
+    return data[:end] + missing + data[end:] # Declarations that are only used in attribute values (eg. mc:Ignorable) are kept.
+
+
+def relationshipsPath(part):
+    '''Return the name of the relationships file of a part (eg. 'xl/worksheets/_rels/sheet1.xml.rels').'''
+    return posixpath.join(posixpath.dirname(part), '_rels', posixpath.basename(part) + '.rels')
+
+
+def targetPart(part, target):
+    '''Return the name of the part that a relationship target (relative to part, or absolute) refers to.'''
+    if target.startswith('/'):
+        return target[1:]
+    return posixpath.normpath(posixpath.join(posixpath.dirname(part), target))
+
+
+def hasPart(archive, name):
+    '''Return True if the zip file has a file with this name.'''
+    try:
+        archive.getinfo(name)
+    except KeyError:
+        return False
+    return True
+
+
+def relationships(archive, part):
+    '''Return the parsed relationships file of a part, or (None, None) if it has no relationships.'''
+    path = relationshipsPath(part)
+    if not hasPart(archive, path):
+        return None, None
+    return readXml(archive.read(path))
+
+
+def relatedParts(archive, part):
+    '''Return the names of every part (and relationships file) reached from a part by its relationships, not including the part itself.'''
+    found = []
+    stack = [part]
+    while stack:
+        current = stack.pop()
+        root, namespaces = relationships(archive, current)
+        if root is None:
+            continue
+        found.append(relationshipsPath(current))
+        for relationship in root:
+            if relationship.get('TargetMode') == 'External':
+                continue
+            related = targetPart(current, relationship.get('Target'))
+            if hasPart(archive, related) and related not in found and related != part:
+                found.append(related)
+                stack.append(related)
+    return found
+
+
+def unsharedParts(archive, parts):
+    '''
+    Return the parts (and relationships files) in parts that are not used by any other part of the workbook, eg. an image or pivot cache that another sheet also refers to.
+    A part is kept if it is the target of a relationship in any relationships file that is kept (so the parts it refers to are also kept). Only relationships files are read.
+    '''
+    removable = set(parts)
+    targets = {}
+    for name in archive.namelist():
+        if name.endswith('.rels'):
+            owner = posixpath.join(posixpath.dirname(posixpath.dirname(name)), posixpath.basename(name)[:-len('.rels')]) # The part this relationships file belongs to.
+            targets[name] = {targetPart(owner, relationship.get('Target')) for relationship in readXml(archive.read(name))[0] if relationship.get('TargetMode') != 'External'}
+    changed = True
+    while changed:
+        changed = False
+        for name, partTargets in targets.items():
+            shared = partTargets & removable
+            if name not in removable and shared:
+                removable -= shared
+                removable -= {relationshipsPath(part) for part in shared} # The relationships of a kept part are also kept.
+                changed = True
+    return [part for part in parts if part in removable]
+
+
+def sheetPart(archive, sheetName):
+    '''Return (part name, relationship id) of a worksheet, or (None, None) if the workbook does not have the sheet.'''
+    workbook = readXml(archive.read('xl/workbook.xml'))[0]
+    for sheet in workbook.find(main('sheets')):
+        if sheet.get('name') == sheetName:
+            relationshipId = sheet.get('{%s}id' % RELATIONSHIP_NAMESPACE)
+            for relationship in relationships(archive, 'xl/workbook.xml')[0]:
+                if relationship.get('Id') == relationshipId:
+                    return targetPart('xl/workbook.xml', relationship.get('Target')), relationshipId
+    return None, None
+
+
+def sheetNames(path):
+    '''Return the names of the worksheets in a workbook (in order). Only the list of sheets is read.'''
+    with zipfile.ZipFile(path) as archive:
+        workbook = readXml(archive.read('xl/workbook.xml'))[0]
+    return [sheet.get('name') for sheet in workbook.find(main('sheets'))]
+
+
+def unusedName(names, part):
+    '''Return a part name like part (eg. 'xl/charts/chart1.xml') with the lowest number not already in names.'''
+    pattern = re.sub(r'\d*(\.\w+)$', r'{}\1', part)
+    number = 1
+    while pattern.format(number) in names:
+        number += 1
+    return pattern.format(number)
+
+
+def canonical(element):
+    '''Return a key for comparing style records (attribute order is ignored).'''
+    return ElementTree.canonicalize(ElementTree.tostring(element))
+
+
+class StyleMerger:
+    '''Adds the cell styles of a scratch workbook to the styles of the existing workbook. Identical records are reused.'''
+
+    def __init__(self, styles, scratchStyles):
+        self.styles = styles
+        self.scratchStyles = scratchStyles
+        self.keys = {} # Canonical record -> position for each list of records.
+        self.xfMap = {} # Scratch cell format number -> existing workbook cell format number.
+        self.changed = False
+
+    def records(self, root, tag):
+        '''Return the list element with a tag (eg. 'fonts'), adding an empty one to the existing styles if needed.'''
+        element = root.find(main(tag))
+        if element is None and root is self.styles:
+            element = ElementTree.Element(main(tag))
+            root.insert(0, element) # Only numFmts can be missing, and it is the first list.
+        return element
+
+    def add(self, tag, record):
+        '''Return the position of a record in a list of the existing styles, adding it if it is not already there.'''
+        container = self.records(self.styles, tag)
+        if tag not in self.keys:
+            self.keys[tag] = {}
+            for position, existing in enumerate(container):
+                self.keys[tag].setdefault(canonical(existing), position)
+        key = canonical(record)
+        if key not in self.keys[tag]:
+            self.keys[tag][key] = len(container)
+            container.append(copy.deepcopy(record))
+            container.set('count', str(len(container)))
+            self.changed = True
+        return self.keys[tag][key]
+
+    def numberFormat(self, formatId):
+        '''Return the id in the existing styles of a scratch number format.'''
+        if formatId < FIRST_CUSTOM_FORMAT:
+            return formatId
+        code = next(numFmt.get('formatCode') for numFmt in self.records(self.scratchStyles, 'numFmts') if int(numFmt.get('numFmtId')) == formatId)
+        container = self.records(self.styles, 'numFmts')
+        for numFmt in container:
+            if numFmt.get('formatCode') == code:
+                return int(numFmt.get('numFmtId'))
+        newId = max([FIRST_CUSTOM_FORMAT - 1] + [int(numFmt.get('numFmtId')) for numFmt in container]) + 1
+        ElementTree.SubElement(container, main('numFmt'), numFmtId=str(newId), formatCode=code)
+        container.set('count', str(len(container)))
+        self.changed = True
+        return newId
+
+    def cellFormat(self, scratchXf):
+        '''Return the number of the existing cell format matching a scratch cell format number.'''
+        if scratchXf not in self.xfMap:
+            xf = copy.deepcopy(self.records(self.scratchStyles, 'cellXfs')[scratchXf])
+            for attribute, tag in [('fontId', 'fonts'), ('fillId', 'fills'), ('borderId', 'borders')]:
+                xf.set(attribute, str(self.add(tag, self.records(self.scratchStyles, tag)[int(xf.get(attribute, 0))])))
+            xf.set('numFmtId', str(self.numberFormat(int(xf.get('numFmtId', 0)))))
+            self.xfMap[scratchXf] = self.add('cellXfs', xf)
+        return self.xfMap[scratchXf]
+
+
+def convertSheet(sheet, sharedStrings, merger):
+    '''Change the cells of a scratch worksheet to use inline strings (instead of the scratch shared strings) and the cell formats of the existing workbook.'''
+    for element in sheet.iter():
+        if element.tag == main('col') and element.get('style') is not None:
+            element.set('style', str(merger.cellFormat(int(element.get('style')))))
+        elif element.tag in (main('row'), main('c')) and element.get('s') is not None:
+            element.set('s', str(merger.cellFormat(int(element.get('s')))))
+        if element.tag == main('c') and element.get('t') == 's':
+            value = element.find(main('v'))
+            inline = ElementTree.SubElement(element, main('is'))
+            inline.extend(copy.deepcopy(list(sharedStrings[int(value.text)])))
+            element.remove(value)
+            element.set('t', 'inlineStr')
+
+
+def deadSpace(path):
+    '''Return the number of bytes of a zip file that are not used by any file in its directory (approximate, as local headers are assumed to be the same size as the directory entries).'''
+    with zipfile.ZipFile(path) as archive:
+        infos = archive.infolist()
+        used = sum(30 + len(info.filename.encode('utf-8')) + len(info.extra) + info.compress_size + (16 if info.flag_bits & 0x08 else 0) for info in infos) # Local headers and data.
+        used += sum(46 + len(info.filename.encode('utf-8')) + len(info.extra) + len(info.comment) for info in infos) + 22 + len(archive.comment) # Directory.
+    return max(os.path.getsize(path) - used, 0)
+
+
+def rewriteWorkbook(path, dropped=(), updated={}):
+    '''Rewrite a workbook zip file without the dropped files (or the space left by replaced files), with the files in updated added or replaced. Only the documented zipfile interface is used.'''
+    temporaryPath = path + '.rewrite'
+    with zipfile.ZipFile(path) as source, zipfile.ZipFile(temporaryPath, 'w', zipfile.ZIP_DEFLATED) as destination:
+        for info in source.infolist():
+            if info.filename not in dropped and info.filename not in updated:
+                destination.writestr(info, source.read(info), compress_type=info.compress_type)
+        for name, data in updated.items():
+            destination.writestr(name, data)
+    os.replace(temporaryPath, path)
+
+
+def appendFiles(path, dropped, updated):
+    '''
+    Write the files in updated over the end of the zip file (its directory), then write the directory again without the dropped files. The files already in the zip file are not rewritten.
+    zipfile cannot remove files, so this uses the ZipFile attributes filelist, NameToInfo and start_dir (not part of its documented interface). This has been checked with CPython 3.8 to 3.13. Returns False (without changing the file) if the attributes are not available.
+    '''
+    with open(path, 'r+b') as workbookFile:
+        archive = zipfile.ZipFile(workbookFile, 'a', zipfile.ZIP_DEFLATED)
+        if not all(hasattr(archive, attribute) for attribute in ZIPFILE_ATTRIBUTES):
+            return False
+        directoryStart = archive.start_dir # Position of the directory (new files are written from here).
+        workbookFile.seek(directoryStart)
+        directory = workbookFile.read() # Kept so the file can be restored if writing fails.
+        try:
+            dropped = set(dropped).union(updated) # Replaced files are also removed from the directory.
+            archive.filelist = [info for info in archive.filelist if info.filename not in dropped]
+            for name in dropped:
+                archive.NameToInfo.pop(name, None)
+            for name, data in updated.items():
+                archive.writestr(name, data)
+            archive.close()
+        except BaseException:
+            workbookFile.seek(directoryStart)
+            workbookFile.write(directory)
+            workbookFile.truncate()
+            raise
+    return True
+
+
+def replaceSheet(path, workbook, sheetName):
+    '''
+    Replace the worksheet sheetName of the workbook at path with the sheet of the same name in an openpyxl workbook (which should hold only that sheet). The sheet is added as the last sheet if it does not exist.
+    The sheet keeps its position. Named cell styles and conditional formats of the new sheet are not supported, and the sheet list in docProps/app.xml (which excel does not use) is not updated.
+    Returns True if the whole workbook was rewritten (when it is compacted).
+    '''
+    scratchFile = io.BytesIO()
+    workbook.save(scratchFile) # Only the new sheet is serialized.
+    scratch = zipfile.ZipFile(scratchFile)
+    scratchSheet = sheetPart(scratch, sheetName)[0]
+    scratchTypes = {override.get('PartName')[1:]: override.get('ContentType') for override in readXml(scratch.read('[Content_Types].xml'))[0] if override.get('PartName')}
+
+    with zipfile.ZipFile(path) as archive:
+        names = set(archive.namelist())
+        existingSheet, relationshipId = sheetPart(archive, sheetName)
+        removed = [] if existingSheet is None else unsharedParts(archive, relatedParts(archive, existingSheet))
+        updated = {} # New contents of the files that are changed or added.
+
+        workbookRelationships, relationshipNamespaces = relationships(archive, 'xl/workbook.xml')
+        if existingSheet is None: # Add the sheet to the sheet list.
+            existingSheet = unusedName(names, 'xl/worksheets/sheet1.xml')
+            workbookRoot, workbookNamespaces = readXml(archive.read('xl/workbook.xml'))
+            sheets = workbookRoot.find(main('sheets'))
+            relationshipIds = {relationship.get('Id') for relationship in workbookRelationships}
+            relationshipId = next('rId{}'.format(number) for number in range(1, len(relationshipIds) + 2) if 'rId{}'.format(number) not in relationshipIds)
+            ElementTree.SubElement(workbookRelationships, '{%s}Relationship' % PACKAGE_NAMESPACE, Id=relationshipId, Type=WORKSHEET_TYPE, Target=posixpath.relpath(existingSheet, 'xl'))
+            ElementTree.SubElement(sheets, main('sheet'), {'name': sheetName, 'sheetId': str(max([0] + [int(sheet.get('sheetId')) for sheet in sheets]) + 1), '{%s}id' % RELATIONSHIP_NAMESPACE: relationshipId})
+            updated['xl/workbook.xml'] = writeXml(workbookRoot, workbookNamespaces)
+            updated['xl/_rels/workbook.xml.rels'] = writeXml(workbookRelationships, relationshipNamespaces)
+        else:
+            for relationship in list(workbookRelationships):
+                if relationship.get('Type') == CALCULATION_CHAIN_TYPE: # The calculation chain may list cells of the old sheet. Excel rebuilds it when it is missing.
+                    removed.append(targetPart('xl/workbook.xml', relationship.get('Target')))
+                    workbookRelationships.remove(relationship)
+                    updated['xl/_rels/workbook.xml.rels'] = writeXml(workbookRelationships, relationshipNamespaces)
+        names.difference_update(removed)
+
+        # Give every file of the new sheet (the sheet, its drawings and charts) a name that is not used in the workbook.
+        newNames = {scratchSheet: existingSheet}
+        for part in relatedParts(scratch, scratchSheet):
+            if not part.endswith('.rels'):
+                newNames[part] = unusedName(names.union(newNames.values()), part)
+        for part, newName in newNames.items():
+            root, namespaces = relationships(scratch, part)
+            if root is not None:
+                for relationship in root:
+                    if relationship.get('TargetMode') != 'External':
+                        relationship.set('Target', posixpath.relpath(newNames[targetPart(part, relationship.get('Target'))], posixpath.dirname(newName)))
+                updated[relationshipsPath(newName)] = writeXml(root, namespaces)
+            if part != scratchSheet:
+                updated[newName] = scratch.read(part)
+
+        styles, stylesNamespaces = readXml(archive.read('xl/styles.xml'))
+        merger = StyleMerger(styles, readXml(scratch.read('xl/styles.xml'))[0])
+        sharedStrings = readXml(scratch.read('xl/sharedStrings.xml'))[0] if hasPart(scratch, 'xl/sharedStrings.xml') else []
+        sheet, sheetNamespaces = readXml(scratch.read(scratchSheet))
+        convertSheet(sheet, sharedStrings, merger)
+        updated[existingSheet] = writeXml(sheet, sheetNamespaces)
+        if merger.changed:
+            updated['xl/styles.xml'] = writeXml(styles, stylesNamespaces)
+
+        contentTypes, contentTypesNamespaces = readXml(archive.read('[Content_Types].xml'))
+        extensions = {default.get('Extension') for default in contentTypes if default.get('Extension')}
+        for element in list(contentTypes):
+            if element.get('PartName', '')[1:] in removed + list(newNames.values()):
+                contentTypes.remove(element)
+        for default in readXml(scratch.read('[Content_Types].xml'))[0]:
+            if default.get('Extension') and default.get('Extension') not in extensions:
+                contentTypes.insert(0, copy.deepcopy(default)) # Defaults are listed before overrides.
+        for part, newName in newNames.items():
+            ElementTree.SubElement(contentTypes, '{%s}Override' % CONTENT_TYPES_NAMESPACE, PartName='/' + newName, ContentType=scratchTypes.get(part, WORKSHEET_CONTENT_TYPE))
+        updated['[Content_Types].xml'] = writeXml(contentTypes, contentTypesNamespaces)
+
+    # The new files are added to the end of the zip file. If this version of python's zipfile module does not allow this, the whole file is rewritten instead.
+    if not appendFiles(path, removed, updated):
+        rewriteWorkbook(path, removed, updated)
+        return True
+    compact = deadSpace(path) > COMPACT_RATIO * os.path.getsize(path)
+    if compact:
+        rewriteWorkbook(path)
+    return compact